@@ -0,0 +1,167 @@
+"""Page generation with asyncio, for sources and outputs on slow storage.
+
+On network-mounted filesystems every open(), stat() and write waits on a
+round trip, and the sequential build spends most of its time waiting.
+Here a bounded queue feeds a fixed number of workers. Each worker reads a
+page's files on a thread pool, renders it on the event loop and hands the
+write back to the thread pool. So the I/O for one page overlaps with the
+rendering of another, and at most in_flight pages are held in memory at
+any time.
+"""
+import asyncio
+import io
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import fragment_key
+from console import info
+from manifest import find_references, hash_bytes
+from stats import NULL_TIMER, PageTimer
+from template import find_template, load_template
+from sync import AtomicFile
+from utility import (find_pages, iter_chunks, open_fragment, page_counts, page_values, render_fragment,
+                     store_fragment_header)
+
+
+class _LoadedPage:
+    __slots__ = ("template_path", "template", "text", "content_hash", "template_hash", "references", "fragment")
+
+    def __init__(self, template_path, template, text, content_hash, template_hash, references, fragment):
+        self.template_path = template_path
+        self.template = template
+        self.text = text
+        self.content_hash = content_hash
+        self.template_hash = template_hash
+        self.references = references
+        # (title, table of contents entries, content HTML) from the content
+        # cache, if it had the page
+        self.fragment = fragment
+
+
+def _load_page(from_path, dest_path, dir_path_content, default_template, basepath, manifest, cache, timer):
+    # Runs on the thread pool: everything that touches the filesystem before
+    # rendering. Returns None for pages the manifest says are up to date.
+    with timer.stage("read"):
+        with open(from_path, "rb") as f:
+            data = f.read()
+    template_path = find_template(from_path, dir_path_content, default_template)
+    content_hash = hash_bytes(data)
+    template_hash = None
+    references = ()
+    if manifest is not None:
+        with timer.stage("manifest check"):
+            template_hash = manifest.template_hash(template_path)
+            if manifest.is_current(dest_path, content_hash, template_hash, basepath):
+                return None
+            references = find_references(data)
+    template = load_template(template_path, basepath)
+    fragment = None
+    if cache is not None:
+        fragment = open_fragment(cache, fragment_key(content_hash, basepath))
+        if fragment is not None:
+            title, toc_entries, f = fragment
+            with f, timer.stage("read"):
+                fragment = title, toc_entries, f.read()
+    # Decoding through StringIO gives the same universal newlines as reading
+    # the file in text mode
+    text = io.StringIO(data.decode("utf-8"), newline=None).read() if fragment is None else None
+    return _LoadedPage(template_path, template, text, content_hash, template_hash, references, fragment)
+
+
+def _render_page(page, basepath, timer):
+    # Runs on the event loop. Returns the page HTML and the fragment to store
+    # in the content cache, or None if it came from there.
+    new_fragment = None
+    fragment = page.fragment
+    if fragment is None:
+        out = io.StringIO()
+        title, toc_entries = render_fragment(iter_chunks(page.text.split("\n")), out, basepath, timer)
+        fragment = new_fragment = title, toc_entries, out.getvalue()
+    title, toc_entries, content = fragment
+    out = io.StringIO()
+    with timer.stage("template render"):
+        page.template.write(out, page_values(title, content, toc_entries))
+    return out.getvalue(), new_fragment
+
+
+def _write_page(dest_path, html, cache, key, fragment, timer):
+    # Runs on the thread pool. Returns whether dest_path changed.
+    if fragment is not None:
+        title, toc_entries, content = fragment
+        with cache.writer(key) as f:
+            f.write(content)
+        store_fragment_header(cache, key, title, toc_entries)
+    with timer.stage("write"):
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        output = AtomicFile(dest_path)
+        with output as f:
+            f.write(html)
+    return output.changed
+
+
+async def _build_pages(dir_path_content, template_path, dest_dir_path, basepath, manifest, in_flight, stats,
+                       cache, shard):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=in_flight)
+    failures = []
+
+    async def generate(executor, from_path, dest_path):
+        timer = PageTimer(from_path) if stats is not None else NULL_TIMER
+        info(f"Processing file {from_path} to {dest_path}...")
+        page = await loop.run_in_executor(executor, _load_page, from_path, dest_path, dir_path_content,
+                                          template_path, basepath, manifest, cache, timer)
+        if page is None:
+            info(f"Skipping unchanged page {from_path}")
+            page_counts["skipped"] += 1
+        else:
+            info(f"Generating page from {from_path} to {dest_path} using template {page.template_path}...")
+            html, fragment = _render_page(page, basepath, timer)
+            key = None
+            if cache is None:
+                fragment = None
+            else:
+                key = fragment_key(page.content_hash, basepath)
+            changed = await loop.run_in_executor(executor, _write_page, dest_path, html, cache, key, fragment, timer)
+            page_counts["written" if changed else "unchanged"] += 1
+            if manifest is not None:
+                manifest.record(dest_path, from_path, page.content_hash, page.template_hash, basepath,
+                                page.template_path, page.references)
+        if stats is not None:
+            stats.add(timer)
+
+    async def worker(executor):
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            from_path, dest_path = job
+            try:
+                await generate(executor, from_path, dest_path)
+            except Exception as e:
+                print(f"Failed to generate {from_path}: {type(e).__name__}: {e}")
+                failures.append((from_path, f"{type(e).__name__}: {e}"))
+
+    with ThreadPoolExecutor(max_workers=in_flight) as executor:
+        pages = await loop.run_in_executor(executor, find_pages, dir_path_content, dest_dir_path, shard)
+        workers = [asyncio.create_task(worker(executor)) for _ in range(in_flight)]
+        for page in pages:
+            await queue.put(page)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    # Pages finish out of order; keep the failure report stable
+    failures.sort()
+    return failures
+
+
+def generate_pages_async(dir_path_content, template_path, dest_dir_path, basepath, manifest=None, in_flight=16,
+                         stats=None, cache=None, shard=None):
+    """Same as utility.generate_pages_recursive, with file I/O on a thread pool.
+
+    Up to in_flight pages are read, rendered and written at once. Log
+    lines of different pages may interleave. Returns the list of
+    (source path, error) for pages that failed.
+    """
+    return asyncio.run(_build_pages(dir_path_content, template_path, dest_dir_path, basepath, manifest,
+                                    max(in_flight, 1), stats, cache, shard))
@@ -0,0 +1,99 @@
+"""Peak memory of building a large document tree.
+
+Builds the node tree for a synthetic inline-heavy document in a fresh
+process, once with the __slots__ node classes and once with plain
+dict-backed classes laid out like the old ones, and prints the peak RSS
+and build time of each.
+
+    python3 src/bench_nodes.py [--paragraphs N]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import utility
+from cache import BlockCache
+from textnode import TextType
+
+
+class DictTextNode:
+    def __init__(self, text, text_type=TextType.TEXT, url=None):
+        self.text = text
+        self.text_type = text_type
+        self.url = url
+
+
+class DictHTMLNode:
+    def __init__(self, tag=None, value=None, children=None, props=None):
+        self.tag = tag
+        self.value = value
+        self.children = children
+        self.props = props
+
+
+class DictLeafNode(DictHTMLNode):
+    def __init__(self, tag, value, props=None):
+        super().__init__(tag, value, None, props)
+
+
+class DictParentNode(DictHTMLNode):
+    def __init__(self, tag, children, props=None):
+        super().__init__(tag, None, children, props)
+
+
+PARAGRAPH = (
+    "Some **bold** text, some _italic_ text, a `code span`, a [link](/blog/tom) "
+    "and an ![image](/images/tom.png) repeated to make inline-heavy paragraphs. "
+)
+
+
+def make_document(paragraphs):
+    return "\n\n".join(PARAGRAPH * 8 for _ in range(paragraphs))
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(layout, paragraphs):
+    # Measure the nodes themselves, not the block cache's reuse of them
+    utility.block_cache = BlockCache(max_bytes=0)
+    if layout == "dict":
+        utility.TextNode = DictTextNode
+        utility.LeafNode = DictLeafNode
+        utility.ParentNode = DictParentNode
+    markdown = make_document(paragraphs)
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    tree = utility.markdown_to_html_node(markdown)
+    elapsed = time.perf_counter() - start
+    print(peak_rss_kb() - before, elapsed, len(tree.children))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=5000)
+    parser.add_argument("--child", choices=["slots", "dict"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child, args.paragraphs)
+        return
+
+    print(f"Building a tree for {args.paragraphs} paragraphs")
+    results = {}
+    for layout in ("dict", "slots"):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", layout, "--paragraphs", str(args.paragraphs)],
+            check=True, capture_output=True, text=True,
+        ).stdout.split()
+        results[layout] = (int(out[0]), float(out[1]))
+        print(f"{layout:>6}: peak RSS +{results[layout][0] / 1024:.1f} MiB, built in {results[layout][1]:.3f}s")
+    saved = 1 - results["slots"][0] / max(results["dict"][0], 1)
+    print(f"__slots__ saves {saved:.0%} of peak memory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Throughput benchmarks for the markdown-to-HTML pipeline.
+
+Each benchmark builds a synthetic corpus, times the best of several runs
+and reports MB/s of markdown (and pages/s where whole pages are built).
+
+    python3 src/bench_pipeline.py [--quick] [-k NAME] [--json out.json] [--compare baseline.json]
+
+--json saves the results together with the current commit so a later run
+can be compared against it with --compare.
+"""
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import highlight
+import htmlnode
+import leafnode
+import utility
+from cache import BlockCache, DiskCache
+from utility import (
+    block_to_block_type,
+    generate_pages_recursive,
+    iter_chunks,
+    block_to_html_nodes,
+    iter_file_chunks,
+    markdown_to_blocks,
+    markdown_to_html_node,
+    text_to_textnodes,
+)
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a benchmark.
+
+    The decorated function takes a scale factor and returns
+    (run, markdown_bytes, pages), where run() is the code being timed.
+    """
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return register
+
+
+INLINE_LINE = (
+    "Some **bold** text, some _italic_ text, a `code span`, a [link](/blog/tom) "
+    "and an ![image](/images/tom.png) in an inline-heavy sentence."
+)
+
+
+def inline_paragraphs(scale):
+    return "\n\n".join("\n".join([INLINE_LINE] * 6) for _ in range(200 * scale))
+
+
+def deep_lists(scale):
+    items = []
+    for i in range(2000 * scale):
+        depth = i % 6
+        marker = "-" if depth % 2 == 0 else "*"
+        items.append("  " * depth + f"{marker} item {i} with **bold** and a [link](/x/{i})")
+    return "\n".join(items)
+
+
+def code_fences(scale):
+    body = "\n".join(f"    def function_{i}(x):\n        return x * {i}  # `not` **inline**" for i in range(200))
+    return "\n\n".join(f"```\n{body}\n```" for _ in range(10 * scale))
+
+
+def mixed_document(scale):
+    return "\n\n".join([
+        "# Benchmark document",
+        inline_paragraphs(scale),
+        deep_lists(scale),
+        code_fences(scale),
+        "\n".join(f"> quoted line {i} with _emphasis_" for i in range(500 * scale)),
+    ])
+
+
+def size(text):
+    return len(text.encode("utf-8"))
+
+
+@benchmark("text_to_textnodes/inline")
+def bench_text_to_textnodes(scale):
+    paragraphs = [" ".join([INLINE_LINE] * 6) for _ in range(200 * scale)]
+    return (lambda: [text_to_textnodes(p) for p in paragraphs]), sum(size(p) for p in paragraphs), 0
+
+
+def bench_unclosed_inline(opener):
+    # One paragraph of images or links that never close, which used to make
+    # the regexes backtrack over the rest of the line from every opener
+    def bench(scale):
+        text = opener * (2000 * scale)
+        return (lambda: text_to_textnodes(text)), size(text), 0
+    return bench
+
+
+benchmark("text_to_textnodes/unclosed_images")(bench_unclosed_inline("![a]("))
+benchmark("text_to_textnodes/unclosed_links")(bench_unclosed_inline("[a]("))
+
+
+@benchmark("iter_chunks/mixed")
+def bench_iter_chunks(scale):
+    markdown = mixed_document(scale)
+    return (lambda: list(iter_chunks(markdown.split("\n")))), size(markdown), 0
+
+
+def large_file(scale):
+    # A big generated source on disk, read back chunk by chunk
+    tmp = tempfile.mkdtemp(prefix="bench-file-")
+    atexit.register(shutil.rmtree, tmp, True)
+    path = os.path.join(tmp, "large.md")
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(5 * scale):
+            f.write(mixed_document(1) + "\n\n")
+    return path
+
+
+@benchmark("iter_chunks/large_file")
+def bench_iter_chunks_file(scale):
+    path = large_file(scale)
+
+    def run():
+        with open(path, "r", encoding="utf-8") as f:
+            for _ in iter_chunks(f):
+                pass
+    return run, os.path.getsize(path), 0
+
+
+@benchmark("iter_file_chunks/large_file")
+def bench_iter_file_chunks(scale):
+    path = large_file(scale)
+
+    def run():
+        for _ in iter_file_chunks(path):
+            pass
+    return run, os.path.getsize(path), 0
+
+
+@benchmark("block_to_block_type/mixed")
+def bench_block_to_block_type(scale):
+    markdown = mixed_document(scale)
+    blocks = markdown_to_blocks(markdown)
+    return (lambda: [block_to_block_type(b) for b in blocks]), size(markdown), 0
+
+
+def long_blocks(scale):
+    # One block of each type, thousands of lines long
+    lines = 5000 * scale
+    return [
+        "\n".join(f"paragraph line {i} with a `code span`" for i in range(lines)),
+        "\n".join(f"- item {i}" for i in range(lines)),
+        "\n".join(f"{i}. item {i}" for i in range(lines)),
+        "\n".join(f"> quoted line {i}" for i in range(lines)),
+        "```\n" + "\n".join(f"    return x * {i}" for i in range(lines)) + "\n```",
+    ]
+
+
+@benchmark("block_to_block_type/long_blocks")
+def bench_block_to_block_type_long(scale):
+    blocks = long_blocks(scale)
+    return (lambda: [block_to_block_type(b) for b in blocks]), sum(size(b) for b in blocks), 0
+
+
+# Worst cases for the block parser. Their MB/s should stay flat as --scale
+# grows, since BlockParser is linear in the size of the block.
+def parser_cases(scale):
+    items = 10000 * scale
+    return {
+        "10k_items": "\n".join(f"- item {i} with **bold**" for i in range(items)),
+        "long_item": "1. " + "\n".join(f"continuation {i} of one item" for i in range(items)),
+        "mixed_markers": "\n".join(["- a", "*b", "+ c", "-- d", "* e", "+f"][i % 6] for i in range(items)),
+        "digit_runs": "1. x\n" + "\n".join("1" * 200 for _ in range(items)),
+        "nested_lists": "\n".join("  " * (i % 8) + f"- item {i}" for i in range(items)),
+        "nested_quotes": "\n".join("> " * (i % 8 + 1) + f"quoted {i}" for i in range(items)),
+        "table": "| a | b | c |\n|:--|:-:|--:|\n" + "\n".join(f"| {i} | **{i}** | `{i}` |" for i in range(items)),
+    }
+
+
+def bench_block_parser(case):
+    def setup(scale):
+        block = parser_cases(scale)[case]
+        return (lambda: block_to_html_nodes(block)), size(block), 0
+    return setup
+
+
+for case in ("10k_items", "long_item", "mixed_markers", "digit_runs", "nested_lists", "nested_quotes", "table"):
+    benchmark(f"block_parser/{case}")(bench_block_parser(case))
+
+
+@benchmark("markdown_to_html_node/inline")
+def bench_html_node_inline(scale):
+    markdown = inline_paragraphs(scale)
+    return (lambda: markdown_to_html_node(markdown)), size(markdown), 0
+
+
+@benchmark("markdown_to_html_node/lists")
+def bench_html_node_lists(scale):
+    markdown = deep_lists(scale)
+    return (lambda: markdown_to_html_node(markdown)), size(markdown), 0
+
+
+@benchmark("markdown_to_html_node/code")
+def bench_html_node_code(scale):
+    markdown = code_fences(scale)
+    return (lambda: markdown_to_html_node(markdown)), size(markdown), 0
+
+
+PYTHON_SNIPPET = '''@cached
+def function_{i}(x, y=0x1F):
+    """Docstring with <markup> & entities."""
+    return len(x) * {i} + y  # trailing comment
+'''
+
+
+def python_fence(scale):
+    return "".join(PYTHON_SNIPPET.format(i=i) for i in range(2000 * scale))
+
+
+@benchmark("highlight/python_large_fence")
+def bench_highlight(scale):
+    code = python_fence(scale)
+    return (lambda: highlight.highlight(code, "python")), size(code), 0
+
+
+@benchmark("highlight/disk_cache_hit")
+def bench_highlight_cached(scale):
+    # The same fence read back from the disk cache instead of tokenized
+    code = python_fence(scale)
+    tmp = tempfile.mkdtemp(prefix="bench-highlight-")
+    atexit.register(shutil.rmtree, tmp, True)
+    cache = DiskCache(tmp)
+
+    def run():
+        saved = highlight.disk_cache
+        highlight.disk_cache = cache
+        try:
+            highlight.highlight(code, "python")
+        finally:
+            highlight.disk_cache = saved
+    run()
+    return run, size(code), 0
+
+
+@benchmark("markdown_to_html_node/highlighted_code")
+def bench_html_node_highlighted(scale):
+    # Only the opening fence of each block gets the language tag
+    markdown = "\n\n".join("```python" + block[3:] for block in code_fences(scale).split("\n\n"))
+    return (lambda: markdown_to_html_node(markdown)), size(markdown), 0
+
+
+@benchmark("to_html/mixed")
+def bench_to_html(scale):
+    markdown = mixed_document(scale)
+    node = markdown_to_html_node(markdown)
+    return node.to_html, size(markdown), 0
+
+
+@benchmark("render/mixed")
+def bench_render(scale):
+    markdown = mixed_document(scale)
+    return (lambda: markdown_to_html_node(markdown).to_html()), size(markdown), 0
+
+
+@benchmark("render/mixed_unescaped")
+def bench_render_unescaped(scale):
+    # render/mixed with escaping switched off, to measure what it costs
+    markdown = mixed_document(scale)
+
+    def unescaped_props(items):
+        return "".join([' ' + name + '="' + value + '"' for name, value in items])
+
+    def run():
+        saved = leafnode.escape_text, leafnode.escape_code, htmlnode.render_props
+        leafnode.escape_text, leafnode.escape_code, htmlnode.render_props = str, str, unescaped_props
+        try:
+            markdown_to_html_node(markdown).to_html()
+        finally:
+            leafnode.escape_text, leafnode.escape_code, htmlnode.render_props = saved
+    return run, size(markdown), 0
+
+
+@benchmark("build/small_pages")
+def bench_build(scale):
+    tmp = tempfile.mkdtemp(prefix="bench-site-")
+    atexit.register(shutil.rmtree, tmp, True)
+    content = os.path.join(tmp, "content")
+    template = os.path.join(tmp, "template.html")
+    with open(template, "w", encoding="utf-8") as f:
+        f.write('<html><head><title>{{ Title }}</title><link href="/index.css"></head><body>{{ Content }}</body></html>')
+    total = 0
+    pages = 200 * scale
+    for i in range(pages):
+        page_dir = os.path.join(content, f"section{i % 10}", f"page{i}")
+        os.makedirs(page_dir)
+        markdown = f"# Page {i}\n\n{INLINE_LINE}\n\n- one\n- two [link](/page{i})\n\n```\ncode {i}\n```\n"
+        with open(os.path.join(page_dir, "index.md"), "w", encoding="utf-8") as f:
+            f.write(markdown)
+        total += size(markdown)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_pages_recursive(content, template, os.path.join(tmp, "docs"), "/")
+    return run, total, pages
+
+
+def measure(run, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scale=1, repeat=5, name_filter=None):
+    results = {}
+    for name, setup in BENCHMARKS:
+        if name_filter and name_filter not in name:
+            continue
+        run, markdown_bytes, pages = setup(scale)
+        seconds = measure(run, repeat)
+        results[name] = {
+            "seconds": seconds,
+            "bytes": markdown_bytes,
+            "mb_per_s": markdown_bytes / seconds / 1e6,
+            "pages": pages,
+            "pages_per_s": pages / seconds if pages else None,
+        }
+    return results
+
+
+def format_result(name, result, baseline=None):
+    line = f"{name:<36} {result['mb_per_s']:8.2f} MB/s"
+    if result["pages_per_s"] is not None:
+        line += f" {result['pages_per_s']:9.0f} pages/s"
+    if baseline is not None and name in baseline:
+        change = result["mb_per_s"] / baseline[name]["mb_per_s"] - 1
+        line += f"  ({change:+.1%} vs baseline)"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller corpora and fewer repeats")
+    parser.add_argument("--scale", type=int, default=2, help="corpus size multiplier")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-k", dest="name_filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    parser.add_argument("--block-cache", action="store_true",
+                        help="keep the block cache on (the corpora repeat blocks, so it hides parsing costs)")
+    args = parser.parse_args(argv)
+    if not args.block_cache:
+        utility.block_cache = BlockCache(max_bytes=0)
+    scale, repeat = (1, 2) if args.quick else (args.scale, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = run_benchmarks(scale, repeat, args.name_filter)
+    for name, result in results.items():
+        print(format_result(name, result, baseline))
+    if "render/mixed" in results and "render/mixed_unescaped" in results:
+        overhead = results["render/mixed"]["seconds"] / results["render/mixed_unescaped"]["seconds"] - 1
+        print(f"Escaping costs {overhead:.1%} of render time")
+
+    if args.json_path:
+        data = {
+            "commit": current_commit(),
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "scale": scale,
+            "results": results,
+        }
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        print(f"Results saved to {args.json_path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
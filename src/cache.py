@@ -0,0 +1,174 @@
+import collections
+import contextlib
+import hashlib
+import os
+import tempfile
+
+from highlight import VERSION as HIGHLIGHT_VERSION
+
+# Bump whenever the HTML produced for the same markdown changes, so entries
+# rendered by an older version are never served, and pages the build
+# manifest recorded with an older version are built again
+FORMAT_VERSION = 9
+
+# Highlighted fences are part of the HTML too
+RENDERER_VERSION = f"{FORMAT_VERSION}.{HIGHLIGHT_VERSION}"
+
+
+class DiskCache:
+    """A size-bounded, least-recently-used cache of text files.
+
+    Entries live in directory/<key[:2]>/<key>. Reading an entry bumps its
+    mtime, and evict() deletes the entries with the oldest mtimes until the
+    cache fits in max_bytes again.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def open(self, key, count=True):
+        # Returns an open text file positioned at the start, or None. With
+        # count=False the lookup is left out of hits and misses, for callers
+        # that count a group of entries as one lookup.
+        path = self.path(key)
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            if count:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        if count:
+            self.hits += 1
+        return f
+
+    @contextlib.contextmanager
+    def writer(self, key):
+        # The entry only appears once the with-block finishes without error
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def merge_counts(self, hits, misses):
+        # Fold in the lookups made through a worker process's copy
+        self.hits += hits
+        self.misses += misses
+
+    def evict(self):
+        if not os.path.isdir(self.directory):
+            return 0
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another build sharing the cache, like a shard, got there first
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+def fragment_key(content_hash, basepath):
+    # Rendered content depends on the markdown, the basepath put in front of
+    # root-relative links and the renderer itself, but not on the template
+    return hashlib.sha256(f"{RENDERER_VERSION}\0{basepath}\0{content_hash}".encode("utf-8")).hexdigest()
+
+
+class BlockCache:
+    """In-memory LRU of rendered HTML for individual markdown blocks.
+
+    Keyed by the block text and the basepath, and bounded by the total
+    length of the cached blocks and their HTML. Blocks bigger than
+    max_entry_bytes are never cached, so that one huge code fence cannot
+    push out everything else.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entry_bytes=64 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, block, basepath, count=True):
+        # With count=False the lookup is left out of hits and misses, for
+        # callers that only know later whether the HTML could be used, and
+        # then count it with count_lookup
+        key = (basepath, block)
+        html = self.entries.get(key)
+        if html is None:
+            if count:
+                self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return html
+
+    def count_lookup(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def put(self, block, basepath, html):
+        size = len(block) + len(html)
+        key = (basepath, block)
+        if size > self.max_entry_bytes or key in self.entries:
+            return
+        self.entries[key] = html
+        self.size += size
+        while self.size > self.max_bytes:
+            (_, old_block), old_html = self.entries.popitem(last=False)
+            self.size -= len(old_block) + len(old_html)
+
+    def merge_counts(self, hits, misses):
+        # Fold in the lookups made by a worker process's own cache
+        self.hits += hits
+        self.misses += misses
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,8 @@
+# Per-file progress messages. Large builds print tens of thousands of these,
+# so --quiet turns them off; errors and summaries are printed regardless.
+quiet = False
+
+
+def info(message):
+    if not quiet:
+        print(message)
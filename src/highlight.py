@@ -0,0 +1,218 @@
+"""Build-time syntax highlighting for fenced code.
+
+The language tag of a fence picks one of a few built-in lexers, so pages
+come out highlighted with nothing beyond the standard library and no
+client-side script. A lexer is a single regex alternation with a named
+group per token class, and highlighting a fence is one finditer pass over
+it. Tokens become <span class="tok-CLASS"> elements, styled in
+static/index.css.
+
+When the build sets disk_cache, highlighted fences are kept there by
+language and content hash, so unchanged code is never tokenized twice.
+"""
+import hashlib
+import re
+
+from htmlnode import escape_code
+
+# Bump whenever a lexer changes, so fences highlighted by an older version
+# are never served from the disk cache, nor pages rendered with them from
+# the content cache
+VERSION = 1
+
+# A cache.DiskCache of highlighted fences, or None. Fences repeated within one
+# process are already rendered once by the block cache.
+disk_cache = None
+
+
+class Lexer:
+    """The tokens of one language, as (token class, regex) rules.
+
+    Where rules overlap, the leftmost match wins, then the earliest rule.
+    words maps keywords and other special identifiers to their token class.
+    Identifiers are matched by one more rule and looked up there, which is
+    much faster than trying every keyword in the regex at each position.
+    inner maps a token class to a lexer for the tokens inside it, like the
+    attributes of an HTML tag. followed_by maps a token class to a
+    (stop regex, allowed stops) pair: a match only counts if the first stop
+    after it is one of the allowed ones. The stop found last is reused for
+    the matches before it, so the check costs one pass over the code rather
+    than a lookahead scan per match.
+    """
+
+    def __init__(self, rules, words=None, word=r"[A-Za-z_]\w*", inner=None, followed_by=None):
+        self.words = words or {}
+        if self.words:
+            rules = rules + [("word", word)]
+        self.pattern = re.compile("|".join(f"(?P<{name}>{regex})" for name, regex in rules), re.MULTILINE)
+        self.inner = inner or {}
+        self.followed_by = {token: (re.compile(stop), frozenset(allowed))
+                            for token, (stop, allowed) in (followed_by or {}).items()}
+
+    def write(self, code, out):
+        # Appends the HTML for code to the list out
+        words = self.words
+        followed_by = self.followed_by
+        stops = {}
+        pos = 0
+        for match in self.pattern.finditer(code):
+            token = match.lastgroup
+            if token == "word":
+                token = words.get(match.group())
+                if token is None:
+                    # Plain identifiers are written with the text around them
+                    continue
+            elif token in followed_by:
+                stop = stops.get(token)
+                if stop is None or stop[0] < match.end():
+                    found = followed_by[token][0].search(code, match.end())
+                    stop = stops[token] = (found.start(), found.group()) if found else (len(code), None)
+                if stop[1] not in followed_by[token][1]:
+                    continue
+            start, end = match.span()
+            if start > pos:
+                out.append(escape_code(code[pos:start]))
+            out.append(SPANS[token])
+            inner = self.inner.get(token)
+            if inner is not None:
+                inner.write(match.group(), out)
+            else:
+                out.append(escape_code(match.group()))
+            out.append("</span>")
+            pos = end
+        if pos < len(code):
+            out.append(escape_code(code[pos:]))
+
+
+def _words(token, *words):
+    return dict.fromkeys(words, token)
+
+
+TOKENS = ("keyword", "builtin", "string", "comment", "number", "decorator", "variable", "property", "tag",
+          "attribute", "entity")
+SPANS = {token: f'<span class="tok-{token}">' for token in TOKENS}
+
+# Strings may run to the end of the fence when they are never closed
+DOUBLE_QUOTED = r'"(?:[^"\\\n]|\\.)*"?'
+SINGLE_QUOTED = r"'(?:[^'\\\n]|\\.)*'?"
+C_COMMENT = r"//[^\n]*|/\*[\s\S]*?(?:\*/|\Z)"
+C_NUMBER = r"\b(?:0[xX][0-9a-fA-F_]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)\b"
+
+PYTHON = Lexer([
+    ("comment", r"#[^\n]*"),
+    ("string", r"(?:\b[rRbBuUfF]{1,2})?(?:\"\"\"[\s\S]*?(?:\"\"\"|\Z)|'''[\s\S]*?(?:'''|\Z)|"
+               + DOUBLE_QUOTED + "|" + SINGLE_QUOTED + ")"),
+    ("decorator", r"@[\w.]+"),
+    ("number", r"\b(?:0[xXoObB][0-9a-fA-F_]+|\d[\d_]*(?:\.\d[\d_]*)?(?:[eE][+-]?\d+)?j?)\b"),
+], words={
+    **_words("keyword", "False", "None", "True", "and", "as", "assert", "async", "await", "break", "class",
+             "continue", "def", "del", "elif", "else", "except", "finally", "for", "from", "global", "if",
+             "import", "in", "is", "lambda", "nonlocal", "not", "or", "pass", "raise", "return", "try", "while",
+             "with", "yield"),
+    **_words("builtin", "print", "len", "range", "open", "super", "self", "cls", "isinstance", "dict", "list",
+             "set", "tuple", "str", "int", "float", "bool", "bytes", "object", "type", "enumerate", "zip", "map",
+             "filter", "sorted", "min", "max", "sum", "any", "all", "iter", "next"),
+})
+
+JAVASCRIPT = Lexer([
+    ("comment", C_COMMENT),
+    ("string", DOUBLE_QUOTED + "|" + SINGLE_QUOTED + r"|`(?:[^`\\]|\\.)*`?"),
+    ("number", C_NUMBER),
+], words={
+    **_words("keyword", "async", "await", "break", "case", "catch", "class", "const", "continue", "default",
+             "delete", "do", "else", "export", "extends", "false", "finally", "for", "from", "function", "if",
+             "import", "in", "instanceof", "interface", "let", "new", "null", "of", "return", "static", "super",
+             "switch", "this", "throw", "true", "try", "type", "typeof", "undefined", "var", "void", "while",
+             "yield"),
+    **_words("builtin", "console", "document", "window", "Math", "JSON", "Object", "Array", "String", "Number",
+             "Promise", "Map", "Set", "Error"),
+}, word=r"[A-Za-z_$][\w$]*")
+
+SHELL = Lexer([
+    ("comment", r"(?:^|(?<=\s))#[^\n]*"),
+    ("string", r'"(?:[^"\\]|\\.)*"?|\'[^\']*\'?'),
+    ("variable", r"\$(?:\{[^}\n]*\}?|\w+|[@#?$!*-])"),
+], words={
+    **_words("keyword", "if", "then", "else", "elif", "fi", "for", "while", "until", "do", "done", "case", "esac",
+             "function", "in", "select", "return", "export", "local"),
+    **_words("builtin", "echo", "cd", "pwd", "exit", "source", "set", "unset", "read", "test", "printf",
+             "python3", "python", "pip", "git", "cp", "mv", "rm", "mkdir", "ls", "cat"),
+}, word=r"(?<![\w.-])[A-Za-z_][\w-]*")
+
+JSON = Lexer([
+    ("property", DOUBLE_QUOTED + r"(?=\s*:)"),
+    ("string", DOUBLE_QUOTED),
+    ("number", r"-?\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b"),
+], words=_words("keyword", "true", "false", "null"))
+
+CSS = Lexer([
+    ("comment", r"/\*[\s\S]*?(?:\*/|\Z)"),
+    ("string", DOUBLE_QUOTED + "|" + SINGLE_QUOTED),
+    ("keyword", r"@[\w-]+|!important\b"),
+    # A name followed by a colon is a property only if a ; or } comes before
+    # any {, which rules out selectors like a:hover
+    ("property", r"(?<![\w-])[\w-]+(?=\s*:)"),
+    ("number", r"#[0-9a-fA-F]{3,8}\b|(?<![\w.-])-?(?:\d+(?:\.\d+)?|\.\d+)(?:%|[a-zA-Z]+\b)?"),
+], followed_by={"property": (r"[{};]", ";}")})
+
+HTML_TAG = Lexer([
+    ("attribute", r"(?<=\s)[\w:.-]+(?=\s*=)"),
+    ("string", r'"[^"]*"?|\'[^\']*\'?'),
+])
+
+HTML = Lexer([
+    ("comment", r"<!--[\s\S]*?(?:-->|\Z)"),
+    ("tag", r"</?[A-Za-z!?][^<>]*>?"),
+    ("entity", r"&#?\w+;"),
+], inner={"tag": HTML_TAG})
+
+LEXERS = {
+    "python": PYTHON,
+    "javascript": JAVASCRIPT,
+    "shell": SHELL,
+    "json": JSON,
+    "css": CSS,
+    "html": HTML,
+}
+
+ALIASES = {
+    "py": "python", "python3": "python",
+    "js": "javascript", "jsx": "javascript", "ts": "javascript", "typescript": "javascript",
+    "sh": "shell", "bash": "shell", "zsh": "shell", "console": "shell",
+    "xml": "html", "svg": "html",
+}
+
+
+def language_name(language):
+    # The name a language tag's lexer is registered under, or None
+    language = language.lower()
+    language = ALIASES.get(language, language)
+    return language if language in LEXERS else None
+
+
+def cache_key(name, code):
+    return hashlib.sha256(f"{VERSION}\0{name}\0{hashlib.sha256(code.encode('utf-8')).hexdigest()}".encode("utf-8")).hexdigest()
+
+
+def highlight(code, language):
+    """Returns code as HTML with its tokens in spans.
+
+    Returns None if there is no lexer for language. The HTML is escaped
+    and goes inside a <code> element.
+    """
+    name = language_name(language)
+    if name is None:
+        return None
+    if disk_cache is not None:
+        key = cache_key(name, code)
+        f = disk_cache.open(key)
+        if f is not None:
+            with f:
+                return f.read()
+    out = []
+    LEXERS[name].write(code, out)
+    html = "".join(out)
+    if disk_cache is not None:
+        with disk_cache.writer(key) as f:
+            f.write(html)
+    return html
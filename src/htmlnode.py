@@ -1,4 +1,57 @@
+import functools
+import io
+import re
+
+from html.entities import html5
+
+# An ampersand, with the character reference it starts if there is one
+AMPERSAND = re.compile(r"&(?:#[0-9]{1,7};|#[xX][0-9a-fA-F]{1,6};|([A-Za-z][A-Za-z0-9]{1,31};))?")
+
+
+def _escape_ampersand(match):
+    reference = match.group()
+    name = match.group(1)
+    if len(reference) > 1 and (name is None or name in html5):
+        return reference
+    # A bare ampersand, or one before a name HTML doesn't know
+    return "&amp;" + reference[1:]
+
+
+def escape_text(text):
+    # Like CommonMark, character references in the markdown (&copy;, &#169;,
+    # &#xA9;) are kept as they are and only bare ampersands are escaped.
+    # Most text has nothing to escape, and finding that out with three
+    # substring checks is much cheaper than rebuilding the string.
+    if "&" not in text and "<" not in text and ">" not in text:
+        return text
+    if "&" in text:
+        text = AMPERSAND.sub(_escape_ampersand, text)
+    return text.replace("<", "&lt;").replace(">", "&gt;")
+
+
+def escape_code(text):
+    # Code is shown as written, so its ampersands are always escaped
+    if "&" not in text and "<" not in text and ">" not in text:
+        return text
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def escape_attribute(value):
+    if '"' not in value and "&" not in value and "<" not in value and ">" not in value:
+        return value
+    return escape_text(value).replace('"', "&quot;")
+
+
+@functools.lru_cache(maxsize=4096)
+def render_props(items):
+    # items is a tuple of (name, value) pairs. Pages repeat the same links
+    # and images, so identical props are only escaped and joined once.
+    return "".join([' ' + name + '="' + escape_attribute(value) + '"' for name, value in items])
+
+
 class HTMLNode:
+    __slots__ = ("tag", "value", "children", "props")
+
     def __init__(self,tag = None, value = None, children = None, props = None):
         self.tag = tag
         self.value = value
@@ -6,17 +59,24 @@ class HTMLNode:
         self.props = props
                 
     def to_html(self):
+        out = io.StringIO()
+        self.write_html(out)
+        return out.getvalue()
+
+    def write_html(self, out):
+        # Serialize into any object with a write() method (a file, a StringIO, ...)
         raise NotImplementedError
 
     def props_to_html(self):
-        result = "" 
+        if self.props is None:
+            return ""
+        return render_props(tuple(self.props.items()))
+
+    def write_props(self, out):
         if self.props is not None:
-            for i,v in self.props.items():
-                result += " "+i+'="'+v+'"' 
-        return result
+            out.write(render_props(tuple(self.props.items())))
     
     def __repr__(self):
         result = ""
         result += f"HTMLNode(tag = {self.tag}, value = {self.value}, children = {self.children}, props = {self.props}"
         return result
-
@@ -1,20 +1,21 @@
-from htmlnode import HTMLNode
+from htmlnode import HTMLNode, escape_code, escape_text
 
 
 class LeafNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag, value, props = None):
         super().__init__(tag,value, None, props)
 
-    def to_html(self):
+    def write_html(self, out):
         if self.value is None:
             raise ValueError("All leaf nodes must have a value")
-        if self.props is None:
-            if self.tag is None:
-                return self.value
-            else:
-                 return "<"+self.tag+">"+self.value+"</"+self.tag+">"
-        elif self.tag is not None: 
-            return "<"+self.tag+self.props_to_html()+">"+self.value+"</"+self.tag+">"
-
-
-
+        if self.tag is None:
+            out.write(escape_text(self.value))
+            return
+        out.write("<"+self.tag)
+        self.write_props(out)
+        out.write(">")
+        # Character references mean nothing inside code spans and blocks
+        out.write(escape_code(self.value) if self.tag == "code" else escape_text(self.value))
+        out.write("</"+self.tag+">")
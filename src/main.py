@@ -1,35 +1,180 @@
+import argparse
+import contextlib
+import cProfile
 import os
-import shutil   
+import pstats
 import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+import console
 from textnode import TextNode, TextType
 from utility import *
+import highlight
+from asyncbuild import generate_pages_async
+from cache import DiskCache
+from manifest import BuildManifest
+from shard import merge_shards, shard_paths
+from stats import BuildStats
+from sync import sync_tree
+
+CONTENT_DIR = "content/"
+STATIC_DIR = "static"
+OUTPUT_DIR = "docs"
+TEMPLATE_PATH = "template.html"
+MANIFEST_PATH = ".build-manifest.json"
+CACHE_DIR = ".cache"
+
+
+def parse_shard(text):
+    # "i/N" for --shard, 1 <= i <= N
+    try:
+        index, count = map(int, text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, like 2/4, not {text!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {index} is not between 1 and {count}")
+    return index, count
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Build the static site into docs/.")
+    parser.add_argument("basepath", nargs="?", default="/", help="URL prefix for root-relative links")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of pages to render in parallel (0 = one per CPU core)")
+    parser.add_argument("--async-io", action="store_true",
+                        help="overlap file I/O with rendering, for sources or docs/ on network storage")
+    parser.add_argument("--in-flight", type=int, default=16, metavar="N",
+                        help="pages (and static files) handled at once with --async-io (default: 16)")
+    parser.add_argument("--link-assets", action="store_true",
+                        help="hardlink static files into docs/ instead of copying them")
+    parser.add_argument("--no-cache", action="store_true", help="don't reuse rendered content from earlier builds")
+    parser.add_argument("--cache-size", type=int, default=512, metavar="MB",
+                        help="size limit of the rendered content cache, plus an eighth of it for "
+                             "highlighted code (default: 512)")
+    parser.add_argument("--shard", type=parse_shard, metavar="i/N",
+                        help="build only the i-th of N shards of the pages, into .shards/ instead of docs/")
+    parser.add_argument("--merge", type=int, metavar="N",
+                        help="copy the pages built by --shard 1/N to N/N (with the same basepath) into docs/")
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't print a line for every file")
+    parser.add_argument("--stats", action="store_true",
+                        help="time every build stage per page and print a breakdown at the end")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run the build under cProfile and save the pstats data to FILE (parent process only with --jobs)")
+    args = parser.parse_args(argv)
+    if args.async_io and args.jobs != 1:
+        parser.error("--async-io renders in one process and can't be combined with --jobs")
+    if args.shard is not None and args.merge is not None:
+        parser.error("--merge runs once all the --shard builds are done and can't be combined with --shard")
+    if args.merge is not None and args.merge < 1:
+        parser.error("--merge needs at least one shard")
+    if args.in_flight < 1:
+        parser.error("--in-flight needs at least one page")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    console.quiet = args.quiet
+    if args.profile:
+        profiler = cProfile.Profile()
+        status = profiler.runcall(build, args)
+        profiler.dump_stats(args.profile)
+        print(f"Profile saved to {args.profile}; the top functions by cumulative time were:")
+        pstats.Stats(args.profile).sort_stats("cumulative").print_stats(20)
+        return status
+    return build(args)
+
 
-def main():
-    basepath = sys.argv[1] if len(sys.argv) > 1 else "/"
+def build(args):
+    if args.merge is not None:
+        return merge(args)
+    basepath = args.basepath
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    stats = BuildStats() if args.stats else None
+    cache = None if args.no_cache else DiskCache(os.path.join(CACHE_DIR, "pages"), args.cache_size * 1024 * 1024)
+    highlight.disk_cache = None if args.no_cache else DiskCache(os.path.join(CACHE_DIR, "highlight"),
+                                                                args.cache_size * 1024 * 1024 // 8)
     print(f"Basepath set to: {basepath}")
-    print("Copying static to docs...")
-    recursive_copy("static", "docs")
+    if args.shard is None:
+        output_dir = OUTPUT_DIR
+        manifest = BuildManifest(MANIFEST_PATH, STATIC_DIR)
+        sync_static(args, manifest, stats)
+    else:
+        # A shard only builds its pages; --merge puts them and the static
+        # files in docs/
+        output_dir, manifest_path = shard_paths(*args.shard)
+        manifest = BuildManifest(manifest_path, STATIC_DIR)
+        print(f"Building shard {args.shard[0]}/{args.shard[1]} into {output_dir}...")
     print("Generating HTML pages...")
-    generate_pages_recursive("content/", "template.html", "docs/", basepath)
-
-
-def recursive_copy(src="static/", dst="public/"):
-    # Delete all content in the destination directory
-    if os.path.exists(dst):
-        print(f"Deleting existing content in {dst}...")
-        shutil.rmtree(dst)
-    print(f"Creating directory {dst}")
-    os.makedirs(dst, exist_ok=True)
-
-    # Recursively copy all content from src to dst
-    for item in os.listdir(src):
-        s = os.path.join(src, item)
-        d = os.path.join(dst, item)
-        if os.path.isdir(s):
-            print(f"Recursive copy {s} to {d}...")
-            recursive_copy(s, d)
+    with step(stats, "pages"):
+        if args.async_io:
+            failures = generate_pages_async(CONTENT_DIR, TEMPLATE_PATH, output_dir, basepath, manifest,
+                                            args.in_flight, stats, cache, args.shard)
         else:
-            print(f"Copying file from {s} to {d}...")
-            shutil.copy2(s, d)
+            failures = generate_pages_recursive(CONTENT_DIR, TEMPLATE_PATH, output_dir, basepath, manifest, jobs,
+                                                stats, cache, args.shard)
+    print(f"Pages: {page_counts['written']} written, {page_counts['unchanged']} unchanged, "
+          f"{page_counts['skipped']} skipped as up to date")
+    with step(stats, "manifest"):
+        manifest.prune()
+        manifest.save()
+    if cache is not None:
+        with step(stats, "cache eviction"):
+            evicted = cache.evict()
+        print(f"Content cache: {cache.hits} hits, {cache.misses} misses, {evicted} evicted")
+        highlight_cache = highlight.disk_cache
+        with step(stats, "cache eviction"):
+            evicted = highlight_cache.evict()
+        print(f"Highlight cache: {highlight_cache.hits} hits, {highlight_cache.misses} misses, {evicted} evicted")
+    print(f"Block cache: {block_cache.hits} hits, {block_cache.misses} misses "
+          f"({block_cache.hit_rate:.0%} hit rate)")
+    if stats is not None:
+        print(stats.report())
+    if failures:
+        print(f"{len(failures)} page(s) failed to generate:")
+        for from_path, error in failures:
+            print(f"  {from_path}: {error}")
+        return 1
+    return 0
+
+
+def merge(args):
+    print(f"Merging {args.merge} shards into {OUTPUT_DIR}...")
+    manifest = BuildManifest(MANIFEST_PATH, STATIC_DIR)
+    problems, copied, unchanged = merge_shards(args.merge, CONTENT_DIR, TEMPLATE_PATH, OUTPUT_DIR, args.basepath,
+                                               manifest, args.link_assets)
+    if problems:
+        print(f"{len(problems)} page(s) missing from the shards, so {OUTPUT_DIR} was left as it was:")
+        for from_path, problem in problems:
+            print(f"  {from_path}: {problem}")
+        return 1
+    print(f"Pages: {copied} copied, {unchanged} unchanged")
+    sync_static(args, manifest, None)
+    manifest.prune()
+    manifest.save()
+    return 0
+
+
+def sync_static(args, manifest, stats):
+    print("Syncing static to docs...")
+    # Pages live in docs/ too; leave the ones from the previous build to the
+    # manifest, and the ones about to be regenerated to the identical-output
+    # check, even when there is no manifest
+    keep = set(manifest.entries) | page_outputs(CONTENT_DIR, OUTPUT_DIR)
+    with step(stats, "static sync"), io_pool(args) as executor:
+        copied, unchanged, removed = sync_tree(STATIC_DIR, OUTPUT_DIR, keep=keep, link=args.link_assets,
+                                               executor=executor)
+    print(f"Static files: {copied} copied, {unchanged} unchanged, {removed} removed")
+
+
+def step(stats, name):
+    return stats.step(name) if stats is not None else contextlib.nullcontext()
+
+
+def io_pool(args):
+    return ThreadPoolExecutor(max_workers=args.in_flight) if args.async_io else contextlib.nullcontext()
+
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
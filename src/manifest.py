@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+
+from cache import RENDERER_VERSION
+from console import info
+
+# The root-relative target of a markdown link or image. Only the "](/url)"
+# part is matched, which never spans lines, so sources can be scanned line
+# by line.
+REFERENCE_PATTERN = re.compile(rb"\]\((/[^)\s]*)")
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_references(data):
+    return {url.decode("utf-8", "replace") for url in REFERENCE_PATTERN.findall(data)}
+
+
+def scan_source(path):
+    # Reads a markdown source once for both its content hash and the
+    # root-relative URLs it links to
+    h = hashlib.sha256()
+    references = set()
+    with open(path, "rb") as f:
+        for line in f:
+            h.update(line)
+            if b"](/" in line:
+                references |= find_references(line)
+    return h.hexdigest(), references
+
+
+class BuildManifest:
+    """Persistent record of what every generated page was built from.
+
+    Entries are keyed by destination path and hold the source path, the
+    content hash, the template (path and hash), the basepath used, the
+    hashes of the static assets the page links to and the version of the
+    renderer that built it. Together they form the
+    dependency graph of the site: a page whose entry still matches all of
+    them (and whose output still exists) does not need to be generated
+    again, and dependents() finds the pages a changed file affects.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path=None, static_dir=None):
+        self.path = path
+        self.static_dir = os.path.normpath(static_dir) if static_dir is not None else None
+        self.entries = {}
+        self.seen = set()
+        self._file_hashes = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get("version") == self.VERSION:
+                self.entries = data.get("pages", {})
+
+    def file_hash(self, path):
+        # Templates and assets are shared by many pages, so hash each one once
+        # per build, or again if it changes while a long-running watch is
+        # using them. None for files that no longer exist.
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        known = self._file_hashes.get(path)
+        if known is None or known[0] != version:
+            known = self._file_hashes[path] = (version, hash_file(path))
+        return known[1]
+
+    def hash_dependencies(self, dest_paths):
+        # Hash the assets the recorded pages link to up front, so that the
+        # worker processes given subset()s get their hashes instead of each
+        # hashing the shared assets again
+        for path in sorted({path for dest_path in dest_paths
+                            for path in self.entries.get(os.path.normpath(dest_path), {}).get("assets", ())}):
+            self.file_hash(path)
+
+    def template_hash(self, template_path):
+        return self.file_hash(template_path)
+
+    def asset_path(self, url):
+        # The file under the static directory a root-relative URL points at,
+        # or None
+        if self.static_dir is None:
+            return None
+        rel_path = urllib.parse.unquote(urllib.parse.urlsplit(url).path).lstrip("/")
+        path = os.path.normpath(os.path.join(self.static_dir, rel_path))
+        if not path.startswith(self.static_dir + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def is_current(self, dest_path, content_hash, template_hash, basepath):
+        dest_path = os.path.normpath(dest_path)
+        self.seen.add(dest_path)
+        entry = self.entries.get(dest_path)
+        if entry is None or not os.path.exists(dest_path):
+            return False
+        return (
+            entry.get("renderer") == RENDERER_VERSION
+            and entry["content_hash"] == content_hash
+            and entry["template_hash"] == template_hash
+            and entry["basepath"] == basepath
+            and all(self.file_hash(path) == asset_hash for path, asset_hash in entry["assets"].items())
+        )
+
+    def record(self, dest_path, source, content_hash, template_hash, basepath, template_path=None,
+               references=()):
+        # references are the root-relative URLs in the page; the ones that
+        # resolve to static files become dependencies of the page
+        dest_path = os.path.normpath(dest_path)
+        self.seen.add(dest_path)
+        assets = {}
+        for url in references:
+            path = self.asset_path(url)
+            if path is not None:
+                assets[path] = self.file_hash(path)
+        self.entries[dest_path] = {
+            "source": os.path.normpath(source),
+            "content_hash": content_hash,
+            "template": os.path.normpath(template_path) if template_path is not None else None,
+            "template_hash": template_hash,
+            "basepath": basepath,
+            "renderer": RENDERER_VERSION,
+            "assets": dict(sorted(assets.items())),
+        }
+
+    def record_entry(self, dest_path, entry):
+        # Record a page under an entry made for it elsewhere, like by a shard
+        dest_path = os.path.normpath(dest_path)
+        self.seen.add(dest_path)
+        self.entries[dest_path] = entry
+
+    def dependents(self, path):
+        # Sources of the pages built from path, as their template or as an
+        # asset they link to
+        path = os.path.normpath(path)
+        return sorted(
+            entry["source"] for entry in self.entries.values()
+            if entry["template"] == path or path in entry["assets"]
+        )
+
+    def subset(self, dest_path, template_path=None):
+        # A manifest holding just one page and the known hashes of its
+        # template and assets, cheap to ship to a worker process
+        part = BuildManifest(static_dir=self.static_dir)
+        dest_path = os.path.normpath(dest_path)
+        paths = [template_path]
+        if dest_path in self.entries:
+            part.entries[dest_path] = self.entries[dest_path]
+            paths.extend(self.entries[dest_path]["assets"])
+        for path in paths:
+            if path in self._file_hashes:
+                part._file_hashes[path] = self._file_hashes[path]
+        return part
+
+    def merge(self, other):
+        for dest_path in other.seen:
+            if dest_path in other.entries:
+                self.entries[dest_path] = other.entries[dest_path]
+        self.seen |= other.seen
+        # Keep the hashes the worker had to compute, for later builds in the
+        # same process, like the rebuilds of a watch
+        self._file_hashes.update(other._file_hashes)
+
+    def remove(self, dest_path):
+        # Delete a page's output and forget it
+        dest_path = os.path.normpath(dest_path)
+        if os.path.exists(dest_path):
+            info(f"Removing stale output {dest_path}...")
+            os.remove(dest_path)
+            try:
+                os.rmdir(os.path.dirname(dest_path))
+            except OSError:
+                pass
+        self.entries.pop(dest_path, None)
+        self.seen.discard(dest_path)
+
+    def prune(self):
+        # Anything recorded by an earlier build but not visited in this one
+        # came from a source that no longer exists
+        removed = sorted(set(self.entries) - self.seen)
+        for dest_path in removed:
+            self.remove(dest_path)
+        return removed
+
+    def save(self):
+        if self.path is None:
+            return
+        data = {"version": self.VERSION, "pages": self.entries}
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
@@ -2,21 +2,19 @@ from htmlnode import HTMLNode
 from leafnode import LeafNode
 
 class ParentNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag, children, props = None):
         super().__init__(tag, None, children, props)
 
-    def to_html(self):
+    def write_html(self, out):
         if self.tag is None:
             raise ValueError("All parent nodes must have tags")
         if self.children is None or self.children == []:
             raise ValueError("All parent nodes must have children")
-        if self.props == None:
-            result = "<"+self.tag+">"
-        else:
-            result = "<"+self.tag+self.props_to_html()+">"
+        out.write("<"+self.tag)
+        self.write_props(out)
+        out.write(">")
         for child in self.children:
-            result += child.to_html()
-        result += "</"+self.tag+">"
-        return result
-
-
+            child.write_html(out)
+        out.write("</"+self.tag+">")
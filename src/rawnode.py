@@ -0,0 +1,12 @@
+from htmlnode import HTMLNode
+
+
+class RawNode(HTMLNode):
+    # HTML that has already been rendered, written out as-is
+    __slots__ = ()
+
+    def __init__(self, html):
+        super().__init__(None, html, None, None)
+
+    def write_html(self, out):
+        out.write(self.value)
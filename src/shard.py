@@ -0,0 +1,67 @@
+"""Sharded builds, for sites too big for one machine's cores.
+
+`main.py --shard i/N` builds only the pages utility.shard_of puts in shard
+i, into .shards/i-of-N/docs with a manifest of its own next to it, and
+leaves docs/ alone. The N shards can run as separate processes or on
+separate machines sharing the source tree. Once all of them are done,
+`main.py --merge N` checks that every page of the site was built by its
+shard from the current sources, copies the pages into docs/ and combines
+the shard manifests into the main one.
+"""
+import os
+
+from console import info
+from manifest import BuildManifest, scan_source
+from sync import copy_file, same_contents
+from template import find_template
+from utility import find_pages, shard_of
+
+SHARD_DIR = ".shards"
+
+
+def shard_paths(index, count):
+    # The output directory and the manifest path of one shard
+    root = os.path.join(SHARD_DIR, f"{index}-of-{count}")
+    return os.path.join(root, "docs"), os.path.join(root, "manifest.json")
+
+
+def merge_shards(count, dir_path_content, template_path, dest_dir_path, basepath, manifest, link=False):
+    """Copies the pages built by shards 1 to count into dest_dir_path.
+
+    Each page is recorded in manifest under its shard's entry. A page whose
+    shard has no current entry for it (never built, failed, or built from
+    older sources or another basepath) is a problem, and if there are any,
+    nothing is copied. Returns (problems, copied, unchanged), problems
+    being (source path, reason) pairs.
+    """
+    shard_manifests = {}
+    pages = []
+    problems = []
+    for from_path, dest_path in find_pages(dir_path_content, dest_dir_path):
+        index = shard_of(from_path, dir_path_content, count)
+        shard_dir, manifest_path = shard_paths(index, count)
+        if index not in shard_manifests:
+            shard_manifests[index] = BuildManifest(manifest_path, manifest.static_dir)
+        shard_manifest = shard_manifests[index]
+        shard_dest = os.path.join(shard_dir, os.path.relpath(dest_path, dest_dir_path))
+        content_hash, _ = scan_source(from_path)
+        template_hash = shard_manifest.template_hash(find_template(from_path, dir_path_content, template_path))
+        if not shard_manifest.is_current(shard_dest, content_hash, template_hash, basepath):
+            problems.append((from_path, f"not built by shard {index}/{count} from the current sources"))
+            continue
+        pages.append((shard_dest, dest_path, shard_manifest.entries[os.path.normpath(shard_dest)]))
+    if problems:
+        return problems, 0, 0
+
+    copied = unchanged = 0
+    for shard_dest, dest_path, entry in pages:
+        # Like written pages, identical ones keep their old mtime
+        if same_contents(shard_dest, dest_path):
+            unchanged += 1
+        else:
+            info(f"Copying page from {shard_dest} to {dest_path}...")
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            copy_file(shard_dest, dest_path, link)
+            copied += 1
+        manifest.record_entry(dest_path, entry)
+    return problems, copied, unchanged
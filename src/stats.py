@@ -0,0 +1,135 @@
+import time
+
+STAGES = (
+    "manifest check",
+    "read",
+    "extract_title",
+    "block split",
+    "inline parse",
+    "serialize",
+    "template render",
+    "write",
+)
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.timer._stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        timer = self.timer
+        timer._stack.pop()
+        timer.times[self.name] = timer.times.get(self.name, 0.0) + elapsed
+        # Time spent in a nested stage only counts towards that stage
+        if timer._stack:
+            parent = timer._stack[-1].name
+            timer.times[parent] = timer.times.get(parent, 0.0) - elapsed
+        return False
+
+
+class PageTimer:
+    """Exclusive wall time per build stage for one page."""
+
+    def __init__(self, path):
+        self.path = path
+        self.times = {}
+        self._stack = []
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    @property
+    def total(self):
+        return sum(self.times.values())
+
+    def __getstate__(self):
+        return {"path": self.path, "times": self.times}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.times = state["times"]
+        self._stack = []
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTimer:
+    """Stands in for a PageTimer when stats are off, at almost no cost."""
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+
+NULL_TIMER = _NullTimer()
+
+
+class BuildStats:
+    def __init__(self):
+        self.pages = []
+        self.steps = {}
+
+    def add(self, timer):
+        if timer is not None:
+            self.pages.append(timer)
+
+    def step(self, name):
+        # Times a whole build step (static sync, page generation, ...)
+        return _Step(self, name)
+
+    def totals(self):
+        totals = {}
+        for timer in self.pages:
+            for name, seconds in timer.times.items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def report(self, slowest=10):
+        lines = []
+        if self.steps:
+            lines.append("Build steps:")
+            for name, seconds in self.steps.items():
+                lines.append(f"  {name:<20} {seconds * 1000:10.1f} ms")
+        totals = self.totals()
+        overall = sum(totals.values())
+        lines.append(f"Page stages ({len(self.pages)} pages, {overall * 1000:.1f} ms in total):")
+        ordered = [name for name in STAGES if name in totals] + sorted(set(totals) - set(STAGES))
+        for name in ordered:
+            share = totals[name] / overall if overall else 0.0
+            lines.append(f"  {name:<20} {totals[name] * 1000:10.1f} ms {share:6.1%}")
+        if self.pages:
+            lines.append("Slowest pages:")
+            for timer in sorted(self.pages, key=lambda t: t.total, reverse=True)[:slowest]:
+                top = max(timer.times, key=timer.times.get)
+                lines.append(f"  {timer.total * 1000:8.1f} ms  {timer.path}  (mostly {top})")
+        return "\n".join(lines)
+
+
+class _Step:
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.steps[self.name] = self.stats.steps.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
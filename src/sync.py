@@ -0,0 +1,175 @@
+import os
+import shutil
+import tempfile
+
+from console import info
+from manifest import hash_file
+
+# mkstemp creates files readable by the owner only; outputs get the same
+# permissions open() would have given them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def is_unchanged(src, dst):
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+        return True
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+def _copy_file_range(src, dst):
+    # Lets the kernel copy (or reflink, on filesystems that support it)
+    # without the data passing through Python
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+    if remaining > 0:
+        raise OSError("copy_file_range stopped early")
+
+
+def copy_file(src, dst, link=False):
+    # The destination may be a hardlink to an older version of the source,
+    # so always unlink it instead of writing through it
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    if hasattr(os, "copy_file_range"):
+        try:
+            _copy_file_range(src, dst)
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def same_contents(path, other):
+    try:
+        if os.path.getsize(path) != os.path.getsize(other):
+            return False
+    except OSError:
+        return False
+    return hash_file(path) == hash_file(other)
+
+
+class AtomicFile:
+    """A text file that replaces path only once it is complete and different.
+
+    The content goes to a temporary file next to path. On a clean exit the
+    temporary file is renamed over path, unless path already holds the same
+    bytes, in which case it is left alone (mtime included) and changed is
+    False. On an error path is left untouched.
+
+        output = AtomicFile(dest_path)
+        with output as f:
+            f.write(html)
+        output.changed
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = None
+
+    def __enter__(self):
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".tmp-")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is not None or same_contents(self._tmp_path, self.path):
+            os.remove(self._tmp_path)
+            self.changed = False
+            return False
+        os.chmod(self._tmp_path, 0o666 & ~_UMASK)
+        os.replace(self._tmp_path, self.path)
+        self.changed = True
+        return False
+
+
+def remove_untracked(path, keep=frozenset()):
+    # Delete everything under path except the files in keep, and any
+    # directory left empty. Returns the number of files removed.
+    removed = 0
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            removed += remove_untracked(entry.path, keep)
+        elif os.path.normpath(entry.path) not in keep:
+            info(f"Removing {entry.path}...")
+            os.remove(entry.path)
+            removed += 1
+    if not os.listdir(path):
+        os.rmdir(path)
+    return removed
+
+
+def sync_tree(src, dst, keep=frozenset(), link=False, executor=None):
+    """Make dst mirror src, copying only files whose size or mtime differ.
+
+    Files in dst with no counterpart in src are deleted, except the paths
+    in keep (normalized), which belong to someone else: the generated
+    pages that share the output directory with the static assets. With
+    link=True assets are hardlinked instead of copied where the filesystem
+    allows it. With an executor (a concurrent.futures.ThreadPoolExecutor)
+    the copies run on it concurrently, which pays off when every file
+    operation waits on a network round trip.
+
+    Returns (copied, unchanged, removed) counts.
+    """
+    if executor is None:
+        return _sync_tree(src, dst, keep, link, copy_file)
+    pending = []
+    counts = _sync_tree(src, dst, keep, link,
+                        lambda s, d, link: pending.append(executor.submit(copy_file, s, d, link)))
+    for future in pending:
+        future.result()
+    return counts
+
+
+def _sync_tree(src, dst, keep, link, copy):
+    copied = unchanged = removed = 0
+    if os.path.lexists(dst) and not os.path.isdir(dst):
+        os.remove(dst)
+    os.makedirs(dst, exist_ok=True)
+    src_entries = {entry.name: entry for entry in os.scandir(src)}
+
+    for entry in os.scandir(dst):
+        source = src_entries.get(entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            if source is None or not source.is_dir():
+                removed += remove_untracked(entry.path, keep)
+        elif source is None and os.path.normpath(entry.path) not in keep:
+            info(f"Removing {entry.path}...")
+            os.remove(entry.path)
+            removed += 1
+
+    for name, entry in sorted(src_entries.items()):
+        d = os.path.join(dst, name)
+        if entry.is_dir():
+            counts = _sync_tree(entry.path, d, keep, link, copy)
+            copied += counts[0]
+            unchanged += counts[1]
+            removed += counts[2]
+        elif is_unchanged(entry.path, d):
+            unchanged += 1
+        else:
+            if os.path.isdir(d) and not os.path.islink(d):
+                shutil.rmtree(d)
+            info(f"Copying file from {entry.path} to {d}...")
+            copy(entry.path, d, link)
+            copied += 1
+    return copied, unchanged, removed
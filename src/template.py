@@ -0,0 +1,82 @@
+import io
+import os
+import re
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# Name of the per-directory template that overrides the default one
+TEMPLATE_FILENAME = "template.html"
+
+
+def rewrite_basepath(html, basepath):
+    return html.replace("href=\"/", f"href=\"{basepath}").replace("src=\"/", f"src=\"{basepath}")
+
+
+class Template:
+    """A template compiled into static segments and {{ name }} slots.
+
+    segments[i] is the text before slots[i], and the last segment is the text
+    after the final slot. Rendering writes the segments and the slot values
+    in turn, so the template text is never searched again.
+    """
+
+    def __init__(self, text):
+        self.segments = []
+        self.slots = []
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self.segments.append(text[pos:match.start()])
+            self.slots.append((match.group(1), match.group(0)))
+            pos = match.end()
+        self.segments.append(text[pos:])
+
+    @property
+    def names(self):
+        return {name for name, _ in self.slots}
+
+    def write(self, out, values):
+        # A value is either a string or a callable that writes itself to out,
+        # which lets large content be streamed. Unknown slots are left as-is.
+        for segment, (name, placeholder) in zip(self.segments, self.slots):
+            out.write(segment)
+            value = values.get(name, placeholder)
+            if callable(value):
+                value(out)
+            else:
+                out.write(value)
+        out.write(self.segments[-1])
+
+    def render(self, values):
+        out = io.StringIO()
+        self.write(out, values)
+        return out.getvalue()
+
+
+_template_cache = {}
+
+
+def load_template(path, basepath="/"):
+    # Compiled once per process and reused until the file changes on disk
+    stat = os.stat(path)
+    key = (path, basepath)
+    cached = _template_cache.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        template = Template(rewrite_basepath(f.read(), basepath))
+    _template_cache[key] = ((stat.st_mtime_ns, stat.st_size), template)
+    return template
+
+
+def find_template(from_path, content_root, default_path):
+    # The nearest template.html in the page's directory or one of its parents
+    # inside the content tree wins; otherwise the site-wide default is used
+    root = os.path.normpath(content_root)
+    directory = os.path.dirname(os.path.normpath(from_path))
+    while True:
+        candidate = os.path.join(directory, TEMPLATE_FILENAME)
+        if os.path.isfile(candidate):
+            return candidate
+        if directory in (root, "", os.path.dirname(directory)):
+            return default_path
+        directory = os.path.dirname(directory)
@@ -0,0 +1,47 @@
+"""A throwaway site directory for tests that build pages on disk."""
+import os
+import tempfile
+import unittest
+
+
+class TempSiteTestCase(unittest.TestCase):
+    """Gives each test an empty temporary directory, self.root.
+
+    Paths passed to the helpers are relative to self.root, with / as the
+    separator; absolute paths are used as they are. Subclasses that override
+    setUp must call super().setUp() first.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def path(self, rel_path):
+        if os.path.isabs(rel_path):
+            return rel_path
+        return os.path.join(self.root, *rel_path.split("/"))
+
+    def write(self, rel_path, text):
+        # Creates the missing directories, and writes text as it is, without
+        # newline translation. Returns the absolute path.
+        path = self.path(rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return path
+
+    def read(self, rel_path):
+        with open(self.path(rel_path), encoding="utf-8") as f:
+            return f.read()
+
+    def read_tree(self, rel_path):
+        # Every file under a directory, as {path relative to it: text}
+        root = self.path(rel_path)
+        files = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                with open(path, encoding="utf-8") as f:
+                    files[os.path.relpath(path, root)] = f.read()
+        return files
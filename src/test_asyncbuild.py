@@ -0,0 +1,93 @@
+import contextlib
+import io
+import os
+import threading
+import unittest
+from unittest import mock
+
+import asyncbuild
+from asyncbuild import generate_pages_async
+from cache import DiskCache
+from main import parse_args
+from manifest import BuildManifest
+from tempsite import TempSiteTestCase
+from utility import generate_pages_recursive
+
+
+class TestAsyncBuild(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = self.path("content")
+        self.template = self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.write("content/index.md", "# Home\r\n\r\nWelcome to [the blog](/blog)")
+        for i in range(12):
+            self.write(f"content/blog/post{i}/index.md", f"# Post {i}\n\n- one\n- two\n\n```\ncode {i}\n```")
+        self.write("content/blog/template.html", "<article>{{ Content }}</article>")
+        self.write("content/broken/index.md", "No title here")
+
+    def build(self, dest, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return generate_pages_async(self.content, self.template, dest, "/base/", **kwargs)
+
+    def test_same_output_as_sequential_build(self):
+        expected = os.path.join(self.root, "expected")
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_pages_recursive(self.content, self.template, expected, "/base/")
+        dest = os.path.join(self.root, "out")
+        failures = self.build(dest, in_flight=4)
+        self.assertEqual([path for path, _ in failures], [os.path.join(self.content, "broken", "index.md")])
+        self.assertEqual(self.read_tree(dest), self.read_tree(expected))
+        self.assertIn('href="/base/blog"', self.read_tree(dest)["index.html"])
+
+    def test_manifest_and_cache(self):
+        dest = os.path.join(self.root, "out")
+        manifest = BuildManifest()
+        cache = DiskCache(os.path.join(self.root, "cache"))
+        self.build(dest, manifest=manifest, cache=cache)
+        first = self.read_tree(dest)
+        self.assertEqual((cache.hits, cache.misses), (0, 14))
+
+        # Unchanged pages are skipped; an output deleted behind the build's
+        # back is rebuilt from the content cache
+        os.remove(os.path.join(dest, "index.html"))
+        with mock.patch.object(asyncbuild, "_write_page", wraps=asyncbuild._write_page) as write_page:
+            self.build(dest, manifest=manifest, cache=cache)
+        self.assertEqual(write_page.call_count, 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(self.read_tree(dest), first)
+
+    def test_in_flight_must_be_positive(self):
+        self.assertEqual(parse_args(["--async-io", "--in-flight", "1"]).in_flight, 1)
+        for value in ("0", "-3"):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parse_args(["--async-io", "--in-flight", value])
+
+    def test_pages_in_flight_are_bounded(self):
+        lock = threading.Lock()
+        active = peak = 0
+
+        def load_page(*args):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            return load(*args)
+
+        def write_page(*args):
+            nonlocal active
+            changed = write(*args)
+            with lock:
+                active -= 1
+            return changed
+
+        load, write = asyncbuild._load_page, asyncbuild._write_page
+        with mock.patch.object(asyncbuild, "_load_page", load_page), \
+                mock.patch.object(asyncbuild, "_write_page", write_page):
+            self.build(os.path.join(self.root, "out"), in_flight=3)
+        # The page without a title never reaches the write
+        self.assertEqual(active, 1)
+        self.assertLessEqual(peak, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
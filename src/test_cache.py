@@ -0,0 +1,137 @@
+import contextlib
+import io
+import os
+import time
+import unittest
+from unittest import mock
+
+import cache
+import highlight
+import utility
+from cache import BlockCache, DiskCache, fragment_key
+from tempsite import TempSiteTestCase
+from utility import generate_page, generate_pages_recursive, markdown_to_html_node
+
+
+class TestDiskCache(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = DiskCache(self.path("cache"), max_bytes=10)
+
+    def put(self, key, text):
+        with self.cache.writer(key) as f:
+            f.write(text)
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.open("ab12"))
+        self.put("ab12", "hello")
+        with self.cache.open("ab12") as f:
+            self.assertEqual(f.read(), "hello")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_failed_write_leaves_nothing(self):
+        with self.assertRaises(ValueError):
+            with self.cache.writer("cd34") as f:
+                f.write("partial")
+                raise ValueError("render failed")
+        self.assertIsNone(self.cache.open("cd34"))
+        self.assertEqual(os.listdir(self.path("cache/cd")), [])
+
+    def test_evicts_least_recently_used(self):
+        self.put("aa01", "12345")
+        self.put("bb02", "12345")
+        self.put("cc03", "12345")
+        past = time.time() - 100
+        os.utime(self.cache.path("aa01"), (past, past))
+        os.utime(self.cache.path("bb02"), (past - 10, past - 10))
+        os.utime(self.cache.path("cc03"), (past - 20, past - 20))
+        self.cache.open("cc03").close()
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertFalse(os.path.exists(self.cache.path("bb02")))
+        self.assertTrue(os.path.exists(self.cache.path("aa01")))
+        self.assertTrue(os.path.exists(self.cache.path("cc03")))
+
+
+class TestFragmentCache(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = self.write("index.md", "Intro\n\n# Title\n\n[home](/)")
+        self.template = self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.dest = self.path("index.html")
+        self.cache = DiskCache(self.path("cache"))
+
+    def build(self, basepath="/"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_page(self.source, self.template, self.dest, basepath, cache=self.cache)
+        return self.read(self.dest)
+
+    def test_template_change_reuses_content(self):
+        self.assertEqual(self.build(), '<title>Title</title><div><p>Intro</p><h1 id="title">Title</h1><p><a href="/">home</a></p></div>')
+        self.write(self.template, "<h1>{{ Title }}</h1>{{ Content }}{{ Content }}")
+        html = self.build()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        content = '<div><p>Intro</p><h1 id="title">Title</h1><p><a href="/">home</a></p></div>'
+        self.assertEqual(html, "<h1>Title</h1>" + content + content)
+
+    def test_basepath_is_part_of_the_key(self):
+        self.build("/")
+        self.assertIn('href="/base/"', self.build("/base/"))
+        self.assertEqual(self.cache.misses, 2)
+        self.assertNotEqual(fragment_key("abc", "/"), fragment_key("abc", "/base/"))
+
+    def test_highlighter_version_is_part_of_the_key(self):
+        key = fragment_key("abc", "/")
+        with mock.patch.object(cache, "RENDERER_VERSION", f"{cache.FORMAT_VERSION}.{highlight.VERSION + 1}"):
+            self.assertNotEqual(fragment_key("abc", "/"), key)
+
+    def test_lookups_counted_once_with_jobs(self):
+        for i in range(5):
+            self.write(f"content/p{i}/index.md", f"# Page {i}")
+        for _ in range(2):
+            with contextlib.redirect_stdout(io.StringIO()):
+                generate_pages_recursive(self.path("content"), self.template, self.path("out"), "/", jobs=2,
+                                         cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (5, 5))
+
+
+class TestBlockCache(unittest.TestCase):
+    def test_lru_within_size_bound(self):
+        cache = BlockCache(max_bytes=25, max_entry_bytes=12)
+        cache.put("aaaa", "/", "<p>a</p>")
+        cache.put("bbbb", "/", "<p>b</p>")
+        self.assertEqual(cache.get("aaaa", "/"), "<p>a</p>")
+        cache.put("cccc", "/", "<p>c</p>")
+        self.assertIsNone(cache.get("bbbb", "/"))
+        self.assertEqual(cache.get("cccc", "/"), "<p>c</p>")
+        self.assertLessEqual(cache.size, 25)
+
+    def test_large_blocks_are_not_cached(self):
+        cache = BlockCache(max_entry_bytes=10)
+        cache.put("x" * 20, "/", "<p>x</p>")
+        self.assertIsNone(cache.get("x" * 20, "/"))
+
+    def test_uncounted_lookups(self):
+        cache = BlockCache()
+        cache.put("a", "/", "<p>a</p>")
+        self.assertEqual(cache.get("a", "/", count=False), "<p>a</p>")
+        self.assertIsNone(cache.get("b", "/", count=False))
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+        cache.count_lookup(True)
+        cache.count_lookup(False)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_repeated_blocks_render_once(self):
+        saved = utility.block_cache
+        utility.block_cache = BlockCache()
+        try:
+            footer = "Licensed under the **MIT** licence, see [LICENSE](/license)"
+            html = markdown_to_html_node(f"# One\n\n{footer}\n\n# Two\n\n{footer}", "/base/").to_html()
+            self.assertEqual(html.count('<p>Licensed under the <b>MIT</b> licence, see <a href="/base/license">LICENSE</a></p>'), 2)
+            self.assertEqual((utility.block_cache.hits, utility.block_cache.misses), (1, 3))
+            self.assertAlmostEqual(utility.block_cache.hit_rate, 0.25)
+        finally:
+            utility.block_cache = saved
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import highlight
+from cache import DiskCache
+from highlight import Lexer, highlight as highlight_code, language_name
+from utility import generate_pages_recursive, markdown_to_html_node
+
+
+class TestHighlight(unittest.TestCase):
+    def test_python(self):
+        self.assertEqual(
+            highlight_code('def f(x):\n    return len(x) + 1  # "done"\n', "python"),
+            '<span class="tok-keyword">def</span> f(x):\n    <span class="tok-keyword">return</span> '
+            '<span class="tok-builtin">len</span>(x) + <span class="tok-number">1</span>  '
+            '<span class="tok-comment"># "done"</span>\n',
+        )
+
+    def test_text_is_escaped(self):
+        html = highlight_code('if a < b and "<b>" != c: pass\n', "py")
+        self.assertIn('<span class="tok-string">"&lt;b&gt;"</span>', html)
+        self.assertIn(" a &lt; b ", html)
+
+    def test_html_tags_have_inner_tokens(self):
+        self.assertEqual(
+            highlight_code('<a href="/x">A &amp; B</a>', "html"),
+            '<span class="tok-tag">&lt;a <span class="tok-attribute">href</span>=<span class="tok-string">"/x"</span>'
+            '&gt;</span>A <span class="tok-entity">&amp;amp;</span> B<span class="tok-tag">&lt;/a&gt;</span>',
+        )
+
+    def test_unterminated_tokens_run_to_the_end(self):
+        self.assertEqual(highlight_code("/* open\ncomment", "css"), '<span class="tok-comment">/* open\ncomment</span>')
+        self.assertEqual(highlight_code('x = """doc', "python"), 'x = <span class="tok-string">"""doc</span>')
+
+    def test_languages(self):
+        self.assertEqual(language_name("JS"), "javascript")
+        self.assertEqual(language_name("bash"), "shell")
+        self.assertIsNone(language_name("cobol"))
+        self.assertIsNone(highlight_code("IDENTIFICATION DIVISION.", "cobol"))
+
+    def test_large_fence_is_linear(self):
+        code = "x = 'unterminated\n" * 20000 + '"""' + "never closed\n" * 20000
+        html = highlight_code(code, "python")
+        self.assertEqual(html.count('<span class="tok-string">'), 20001)
+
+    def test_css_properties(self):
+        self.assertEqual(
+            highlight_code("a:hover { color: red }", "css"),
+            'a:hover { <span class="tok-property">color</span>: red }',
+        )
+        # Each name once looked ahead to the end of the run for a ; or }
+        code = "a:" * 100000
+        self.assertEqual(highlight_code(code, "css"), code)
+        self.assertEqual(highlight_code(code + ";", "css").count('<span class="tok-property">'), 100000)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(tmp)
+            with mock.patch.object(highlight, "disk_cache", cache), \
+                    mock.patch.object(Lexer, "write", wraps=highlight.PYTHON.write) as write:
+                first = highlight_code("print(1)\n", "python")
+                self.assertEqual(highlight_code("print(1)\n", "py"), first)
+                highlight_code("print(2)\n", "python")
+            self.assertEqual(write.call_count, 2)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+
+class TestHighlightedFences(unittest.TestCase):
+    def test_fence_language(self):
+        md = "```python extra words\nx = 1\n```\n\n```cobol\nA < B\n```\n\n```\nplain\n```"
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            '<div><pre><code class="language-python">x = <span class="tok-number">1</span>\n</code></pre>'
+            '<pre><code class="language-cobol">A &lt; B\n</code></pre><pre><code>plain\n</code></pre></div>',
+        )
+
+    def test_worker_processes_share_the_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            content = os.path.join(tmp, "content")
+            template = os.path.join(tmp, "template.html")
+            for i in range(4):
+                os.makedirs(os.path.join(content, f"p{i}"))
+                with open(os.path.join(content, f"p{i}", "index.md"), "w", encoding="utf-8") as f:
+                    f.write(f"# Page {i}\n\n```py\nprint({i})\n```")
+            with open(template, "w", encoding="utf-8") as f:
+                f.write("{{ Content }}")
+            cache = DiskCache(os.path.join(tmp, "cache"))
+            with mock.patch.object(highlight, "disk_cache", cache), contextlib.redirect_stdout(io.StringIO()):
+                generate_pages_recursive(content, template, os.path.join(tmp, "out"), "/", jobs=2)
+            self.assertEqual((cache.hits, cache.misses), (0, 4))
+            self.assertEqual(sum(len(files) for _, _, files in os.walk(cache.directory)), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
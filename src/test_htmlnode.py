@@ -1,6 +1,8 @@
 import unittest
 
 from htmlnode import HTMLNode 
+from leafnode import LeafNode
+from parentnode import ParentNode
 
 
 class TestHTMLNode(unittest.TestCase):
@@ -8,6 +10,10 @@ class TestHTMLNode(unittest.TestCase):
         node = HTMLNode(props = {"href":"https://www.google.com", "target":"_blank",})
         self.assertEqual(node.props_to_html(), ' href="https://www.google.com" target="_blank"')
 
+    def test_props_are_escaped(self):
+        node = HTMLNode(props={"alt": 'Say "hi" & <wave>', "src": "/a.png"})
+        self.assertEqual(node.props_to_html(), ' alt="Say &quot;hi&quot; &amp; &lt;wave&gt;" src="/a.png"')
+
     def test_empty_HTMLNode(self):
         node = HTMLNode()
         # Test that the node was created with default values
@@ -45,6 +51,9 @@ class TestHTMLNode(unittest.TestCase):
         self.assertEqual(len(node2.children), 1) # type: ignore
         self.assertEqual(node2.props["href"], "https://www.google.com") # type: ignore
         self.assertEqual(node2.props["target"], "_blank") # type: ignore
+    def test_no_instance_dict(self):
+        for node in (HTMLNode(), LeafNode("b", "x"), ParentNode("p", [])):
+            self.assertFalse(hasattr(node, "__dict__"))
 
 if __name__ == "__main__":
     unittest.main()
@@ -21,6 +21,18 @@ class TestLeafNode(unittest.TestCase):
         node = LeafNode(None, "Raw text")
         self.assertEqual(node.to_html(), "Raw text")
             
+    def test_leaf_to_html_escapes_value(self):
+        self.assertEqual(LeafNode("code", "a < b && c").to_html(), "<code>a &lt; b &amp;&amp; c</code>")
+        self.assertEqual(LeafNode(None, 'Say "hi"').to_html(), 'Say "hi"')
+
+    def test_leaf_to_html_keeps_character_references(self):
+        self.assertEqual(LeafNode("b", "&copy; 2024 &mdash; &#169; &#xA9; &amp; Co").to_html(),
+                         "<b>&copy; 2024 &mdash; &#169; &#xA9; &amp; Co</b>")
+        self.assertEqual(LeafNode(None, "R&D &nope; &copy &#; AT&T;").to_html(),
+                         "R&amp;D &amp;nope; &amp;copy &amp;#; AT&amp;T;")
+        # But not in code, which shows them as written
+        self.assertEqual(LeafNode("code", "&copy;").to_html(), "<code>&amp;copy;</code>")
+
     def test_leaf_to_html_novalue(self):
         node = LeafNode("p", None)
         with self.assertRaises(ValueError):
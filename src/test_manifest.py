@@ -0,0 +1,108 @@
+import os
+import pickle
+import unittest
+from unittest import mock
+
+import manifest
+from manifest import BuildManifest
+from tempsite import TempSiteTestCase
+from utility import generate_page
+
+
+class TestBuildManifest(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = self.write("index.md", "# Title\n\nSome text")
+        self.template = self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.dest = self.path("index.html")
+        self.manifest_path = self.path("manifest.json")
+        self.static = self.path("static")
+        self.image = self.write("static/images/tom.png", "png")
+
+    def build(self, basepath="/"):
+        manifest = BuildManifest(self.manifest_path, self.static)
+        written = generate_page(self.source, self.template, self.dest, basepath, manifest)
+        manifest.prune()
+        manifest.save()
+        return written
+
+    def test_unchanged_page_is_skipped(self):
+        self.assertTrue(self.build())
+        self.assertFalse(self.build())
+
+    def test_content_change_rebuilds(self):
+        self.build()
+        self.write(self.source, "# Title\n\nOther text")
+        self.assertTrue(self.build())
+
+    def test_template_change_rebuilds(self):
+        self.build()
+        self.write(self.template, "<h1>{{ Title }}</h1>{{ Content }}")
+        self.assertTrue(self.build())
+
+    def test_renderer_change_rebuilds(self):
+        self.build()
+        with mock.patch.object(manifest, "RENDERER_VERSION", "0.0"):
+            self.assertTrue(self.build())
+            self.assertFalse(self.build())
+
+    def test_asset_change_rebuilds_pages_using_it(self):
+        self.write(self.source, "# Title\n\n![Tom](/images/tom.png?v=1) and [home](/) and [away](https://x.org/a.png)")
+        self.build()
+        manifest = BuildManifest(self.manifest_path, self.static)
+        self.assertEqual(manifest.dependents(self.image), [os.path.normpath(self.source)])
+        self.assertEqual(manifest.dependents(self.template), [os.path.normpath(self.source)])
+        self.assertEqual(manifest.dependents(os.path.join(self.static, "index.css")), [])
+        self.assertFalse(self.build())
+        self.write(self.image, "new png")
+        self.assertTrue(self.build())
+        os.remove(self.image)
+        self.assertTrue(self.build())
+
+    def test_subset_carries_dependency_hashes(self):
+        self.write(self.source, "# Title\n\n![Tom](/images/tom.png)")
+        self.build()
+        parent = BuildManifest(self.manifest_path, self.static)
+        parent.template_hash(self.template)
+        parent.hash_dependencies([self.dest])
+        part = pickle.loads(pickle.dumps(parent.subset(self.dest, self.template)))
+        # A worker checks the page without hashing anything itself
+        with mock.patch.object(manifest, "hash_file") as hash_file:
+            self.assertTrue(part.is_current(self.dest, manifest.scan_source(self.source)[0],
+                                            part.template_hash(self.template), "/"))
+        hash_file.assert_not_called()
+        self.write(self.image, "new png")
+        part.file_hash(self.image)
+        parent.merge(part)
+        with mock.patch.object(manifest, "hash_file") as hash_file:
+            parent.file_hash(self.image)
+        hash_file.assert_not_called()
+
+    def test_asset_path_stays_in_static(self):
+        manifest = BuildManifest(static_dir=self.static)
+        self.assertEqual(manifest.asset_path("/images/tom.png#top"), os.path.normpath(self.image))
+        self.assertIsNone(manifest.asset_path("/images"))
+        self.assertIsNone(manifest.asset_path("/../index.md"))
+        self.assertIsNone(BuildManifest().asset_path("/images/tom.png"))
+
+    def test_basepath_change_rebuilds(self):
+        self.build("/")
+        self.assertTrue(self.build("/ss-gen/"))
+
+    def test_missing_output_rebuilds(self):
+        self.build()
+        os.remove(self.dest)
+        self.assertTrue(self.build())
+
+    def test_prune_removes_stale_outputs(self):
+        self.build()
+        manifest = BuildManifest(self.manifest_path)
+        removed = manifest.prune()
+        manifest.save()
+        self.assertEqual(removed, [os.path.normpath(self.dest)])
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertEqual(BuildManifest(self.manifest_path).entries, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
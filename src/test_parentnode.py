@@ -1,3 +1,4 @@
+import io
 import unittest
 
 from leafnode import LeafNode
@@ -56,6 +57,19 @@ class TestParentNode(unittest.TestCase):
         with self.assertRaises(ValueError):
             node.to_html()
 
+    def test_write_html_to_stream(self):
+        items = [ParentNode("li", [LeafNode("b", str(i))]) for i in range(3)]
+        parent_node = ParentNode("ul", items, {"class": "list"})
+        out = io.StringIO()
+        parent_node.write_html(out)
+        self.assertEqual(out.getvalue(), '<ul class="list"><li><b>0</b></li><li><b>1</b></li><li><b>2</b></li></ul>')
+        self.assertEqual(parent_node.to_html(), out.getvalue())
+
+    def test_write_html_nochild(self):
+        node = ParentNode("a", [])
+        with self.assertRaises(ValueError):
+            node.write_html(io.StringIO())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from main import parse_args
+from tempsite import TempSiteTestCase
+from utility import find_pages, shard_of
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+class TestShardOf(TempSiteTestCase):
+    def test_every_page_in_one_shard(self):
+        for i in range(40):
+            self.write(f"p{i}/index.md", "")
+        pages = find_pages(self.root, "docs")
+        shards = [find_pages(self.root, "docs", (index, 4)) for index in range(1, 5)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(pages))
+        self.assertTrue(all(shards))
+
+    def test_depends_only_on_the_path_in_the_content_tree(self):
+        self.assertEqual(shard_of("content/blog/tom/index.md", "content", 7),
+                         shard_of(os.path.join("/srv", "site", "content", "blog", "tom", "index.md"),
+                                  os.path.join("/srv", "site", "content"), 7))
+        self.assertIn(shard_of("content/index.md", "content", 3), (1, 2, 3))
+
+    def test_arguments(self):
+        self.assertEqual(parse_args(["--shard", "2/4"]).shard, (2, 4))
+        for argv in (["--shard", "0/4"], ["--shard", "5/4"], ["--shard", "two"], ["--shard", "1/2", "--merge", "2"]):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parse_args(argv)
+
+
+class TestShardedBuild(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        for site in ("plain", "sharded"):
+            self.write(f"{site}/template.html", "<title>{{ Title }}</title>{{ Content }}")
+            self.write(f"{site}/static/index.css", "body {}")
+            self.write(f"{site}/content/index.md", "# Home\n\n[post](/blog/post0)")
+            for i in range(10):
+                self.write(f"{site}/content/blog/post{i}/index.md", f"# Post {i}\n\n```py\nprint({i})\n```")
+
+    def run_main(self, site, *argv):
+        return subprocess.run([sys.executable, MAIN, "-q", "/base/", *argv], cwd=site, capture_output=True,
+                              text=True)
+
+    def build_shards(self, site, indices, count):
+        # Separate processes, all running at once
+        shards = [subprocess.Popen([sys.executable, MAIN, "-q", "/base/", "--shard", f"{index}/{count}"], cwd=site,
+                                   stdout=subprocess.DEVNULL) for index in indices]
+        self.assertEqual([shard.wait() for shard in shards], [0] * len(shards))
+
+    def test_merged_shards_match_a_single_build(self):
+        plain, sharded = self.path("plain"), self.path("sharded")
+        self.assertEqual(self.run_main(plain).returncode, 0)
+        self.build_shards(sharded, range(1, 4), 3)
+        self.assertFalse(os.path.exists(os.path.join(sharded, "docs")))
+        merge = self.run_main(sharded, "--merge", "3")
+        self.assertEqual(merge.returncode, 0, merge.stdout)
+        self.assertIn("Pages: 11 copied, 0 unchanged", merge.stdout)
+        self.assertEqual(self.read_tree("sharded/docs"), self.read_tree("plain/docs"))
+
+        with open(os.path.join(sharded, ".build-manifest.json"), encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)["pages"]), 11)
+        # The merged manifest lets an ordinary build skip every page
+        self.assertIn("0 written, 0 unchanged, 11 skipped", self.run_main(sharded).stdout)
+
+    def test_merge_refuses_missing_or_outdated_pages(self):
+        sharded = self.path("sharded")
+        self.build_shards(sharded, (1, 2), 3)
+        merge = self.run_main(sharded, "--merge", "3")
+        self.assertEqual(merge.returncode, 1)
+        self.assertIn("not built by shard 3/3", merge.stdout)
+        self.assertFalse(os.path.exists(os.path.join(sharded, "docs")))
+
+        self.build_shards(sharded, (3,), 3)
+        self.write("sharded/content/index.md", "# Home, edited")
+        merge = self.run_main(sharded, "--merge", "3")
+        self.assertEqual(merge.returncode, 1)
+        self.assertEqual(merge.stdout.count("not built by shard"), 1)
+        self.assertIn("content/index.md", merge.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
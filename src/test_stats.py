@@ -0,0 +1,62 @@
+import contextlib
+import io
+import os
+import time
+import unittest
+
+import console
+from stats import BuildStats, PageTimer
+from tempsite import TempSiteTestCase
+from utility import generate_pages_recursive
+
+
+class TestPageTimer(unittest.TestCase):
+    def test_nested_stage_time_is_exclusive(self):
+        timer = PageTimer("page.md")
+        with timer.stage("outer"):
+            time.sleep(0.01)
+            with timer.stage("inner"):
+                time.sleep(0.02)
+        self.assertGreaterEqual(timer.times["inner"], 0.02)
+        self.assertLess(timer.times["outer"], 0.02)
+        self.assertAlmostEqual(timer.total, timer.times["outer"] + timer.times["inner"])
+
+
+class TestBuildStats(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = self.path("content")
+        self.template = self.write("template.html", "{{ Content }}")
+        for name in ("a", "b"):
+            self.write(f"content/{name}/index.md", f"# {name}\n\nSome **text**")
+
+    def tearDown(self):
+        console.quiet = False
+
+    def build(self, jobs):
+        stats = BuildStats()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            generate_pages_recursive(self.content, self.template, os.path.join(self.root, "docs"), "/",
+                                     jobs=jobs, stats=stats)
+        return stats, out.getvalue()
+
+    def test_collects_stages_per_page(self):
+        for jobs in (1, 2):
+            stats, _ = self.build(jobs)
+            self.assertEqual(len(stats.pages), 2)
+            for stage in ("read", "extract_title", "block split", "inline parse", "serialize", "template render"):
+                self.assertIn(stage, stats.totals())
+            report = stats.report()
+            self.assertIn("Slowest pages:", report)
+            self.assertIn(os.path.join(self.content, "a", "index.md"), report)
+
+    def test_quiet_build_prints_nothing(self):
+        console.quiet = True
+        for jobs in (1, 2):
+            _, log = self.build(jobs)
+            self.assertEqual(log, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
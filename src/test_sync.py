@@ -0,0 +1,102 @@
+import contextlib
+import io
+import os
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sync import AtomicFile, sync_tree
+from tempsite import TempSiteTestCase
+
+
+class TestSyncTree(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src = self.path("static")
+        self.dst = self.path("docs")
+        self.write("static/index.css", "body {}")
+        self.write("static/images/tom.png", "tom")
+        self.write("static/images/old.png", "old")
+
+    def sync(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync_tree(self.src, self.dst, **kwargs)
+
+    def test_copies_then_skips_unchanged(self):
+        self.assertEqual(self.sync(), (3, 0, 0))
+        self.assertEqual(self.sync(), (0, 3, 0))
+        self.assertEqual(self.read("docs/images/tom.png"), "tom")
+
+    def test_copies_on_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(self.sync(executor=executor), (3, 0, 0))
+            self.assertEqual(self.sync(executor=executor), (0, 3, 0))
+        self.assertEqual(self.read("docs/images/tom.png"), "tom")
+
+    def test_copies_changed_and_removes_deleted(self):
+        self.sync()
+        self.write("static/index.css", "body { color: red }")
+        os.remove(os.path.join(self.src, "images", "old.png"))
+        self.assertEqual(self.sync(), (1, 1, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.dst, "images", "old.png")))
+
+    def test_keeps_generated_pages(self):
+        self.sync()
+        page = os.path.normpath(self.write("docs/blog/tom/index.html", "<p>tom</p>"))
+        stray = self.write("docs/blog/stray.html", "gone")
+        self.sync(keep={page})
+        self.assertTrue(os.path.exists(page))
+        self.assertFalse(os.path.exists(stray))
+
+    def test_removes_directory_missing_from_source(self):
+        self.sync()
+        self.write("docs/old/deep/file.txt", "x")
+        self.sync()
+        self.assertFalse(os.path.exists(os.path.join(self.dst, "old")))
+
+    def test_hardlinks(self):
+        self.sync(link=True)
+        src_stat = os.stat(os.path.join(self.src, "index.css"))
+        dst_stat = os.stat(os.path.join(self.dst, "index.css"))
+        self.assertEqual(src_stat.st_ino, dst_stat.st_ino)
+        self.assertEqual(self.sync(link=True), (0, 3, 0))
+
+
+class TestAtomicFile(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page = self.path("index.html")
+
+    def write_page(self, text):
+        output = AtomicFile(self.page)
+        with output as f:
+            f.write(text)
+        return output.changed
+
+    def test_identical_content_keeps_the_file(self):
+        self.assertTrue(self.write_page("<p>one</p>"))
+        os.utime(self.page, (1000, 1000))
+        self.assertFalse(self.write_page("<p>one</p>"))
+        self.assertEqual(os.stat(self.page).st_mtime, 1000)
+        self.assertTrue(self.write_page("<p>two</p>"))
+        self.assertEqual(self.read("index.html"), "<p>two</p>")
+        self.assertEqual(os.listdir(self.root), ["index.html"])
+
+    def test_failed_write_keeps_the_old_file(self):
+        self.write_page("<p>one</p>")
+        with self.assertRaises(ValueError):
+            with AtomicFile(self.page) as f:
+                f.write("<p>half")
+                raise ValueError("render failed")
+        self.assertEqual(self.read("index.html"), "<p>one</p>")
+        self.assertEqual(os.listdir(self.root), ["index.html"])
+
+    def test_permissions_follow_umask(self):
+        self.write_page("<p>one</p>")
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(self.page).st_mode & 0o777, 0o666 & ~umask)
+
+
+if __name__ == "__main__":
+    unittest.main()
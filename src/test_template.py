@@ -0,0 +1,50 @@
+import os
+import unittest
+
+from template import Template, find_template, load_template
+from tempsite import TempSiteTestCase
+
+
+class TestTemplate(unittest.TestCase):
+    def test_compile_segments(self):
+        template = Template("<title>{{ Title }}</title><main>{{Content}}</main>")
+        self.assertEqual(template.segments, ["<title>", "</title><main>", "</main>"])
+        self.assertEqual(template.names, {"Title", "Content"})
+
+    def test_render_arbitrary_variables(self):
+        template = Template("{{ Title }} by {{ Author }}, {{ Title }} again")
+        self.assertEqual(
+            template.render({"Title": "Tom", "Author": "JRR"}),
+            "Tom by JRR, Tom again",
+        )
+
+    def test_unknown_placeholder_is_kept(self):
+        template = Template("<p>{{ Missing }}</p>")
+        self.assertEqual(template.render({}), "<p>{{ Missing }}</p>")
+
+    def test_callable_value_streams(self):
+        template = Template("<article>{{ Content }}</article>")
+        html = template.render({"Content": lambda out: out.write("<p>streamed</p>")})
+        self.assertEqual(html, "<article><p>streamed</p></article>")
+
+
+class TestLoadTemplate(TempSiteTestCase):
+    def test_cached_until_changed(self):
+        path = self.write("template.html", '<link href="/index.css">{{ Content }}')
+        first = load_template(path, "/base/")
+        self.assertIs(load_template(path, "/base/"), first)
+        self.assertEqual(first.segments[0], '<link href="/base/index.css">')
+        self.write("template.html", "<main>{{ Content }}</main>")
+        os.utime(path, ns=(0, 0))
+        self.assertEqual(load_template(path, "/base/").segments[0], "<main>")
+
+    def test_find_template_per_directory(self):
+        default = self.write("template.html", "{{ Content }}")
+        blog_template = self.write("content/blog/template.html", "<blog>{{ Content }}</blog>")
+        content = self.path("content")
+        self.assertEqual(find_template(os.path.join(content, "index.md"), content, default), default)
+        self.assertEqual(find_template(os.path.join(content, "blog", "tom", "index.md"), content, default), blog_template)
+
+
+if __name__ == "__main__":
+    unittest.main()
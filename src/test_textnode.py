@@ -28,6 +28,15 @@ class TestTextNode(unittest.TestCase):
         node = TextNode("This is some anchor text", TextType.LINK,"https://www.boot.dev")
         node2 = TextNode("This is some anchor text", TextType.LINK,"https://www.boot.org")
         self.assertNotEqual(node,node2)
+    def test_repr(self):
+        node = TextNode("anchor", TextType.LINK, "https://www.boot.dev")
+        self.assertEqual(repr(node), "TextNode(anchor, a, https://www.boot.dev)")
+
+    def test_no_instance_dict(self):
+        node = TextNode("This is a text node")
+        self.assertFalse(hasattr(node, "__dict__"))
+        with self.assertRaises(AttributeError):
+            node.extra = 1  # type: ignore
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,106 @@
+import contextlib
+import io
+import os
+import unittest
+
+import utility
+from asyncbuild import generate_pages_async
+from cache import BlockCache, DiskCache, fragment_key
+from manifest import scan_source
+from tempsite import TempSiteTestCase
+from toc import TableOfContents, slugify, toc_html
+from utility import HEADER_SUFFIX, generate_page, markdown_to_html_node
+
+
+class TestTableOfContents(unittest.TestCase):
+    def test_slugify(self):
+        self.assertEqual(slugify("Hello, World!"), "hello-world")
+        self.assertEqual(slugify("  The Lord of the Rings (1954) "), "the-lord-of-the-rings-1954")
+        self.assertEqual(slugify("Éowyn's song"), "éowyns-song")
+        self.assertEqual(slugify("?!"), "section")
+
+    def test_repeated_slugs(self):
+        toc = TableOfContents()
+        self.assertEqual([toc.add(2, text) for text in ("Notes", "Notes 1", "Notes", "Notes")],
+                         ["notes", "notes-1", "notes-2", "notes-3"])
+
+    def test_nested_lists(self):
+        entries = [[1, "a", "A"], [2, "b", "B"], [3, "c", "C & D"], [2, "e", "E"], [1, "f", "F"]]
+        self.assertEqual(
+            toc_html(entries),
+            '<ul><li><a href="#a">A</a><ul><li><a href="#b">B</a><ul><li><a href="#c">C &amp; D</a></li></ul></li>'
+            '<li><a href="#e">E</a></li></ul></li><li><a href="#f">F</a></li></ul>',
+        )
+        self.assertEqual(toc_html([[3, "x", "X"], [1, "y", "Y"]]),
+                         '<ul><li><a href="#x">X</a></li><li><a href="#y">Y</a></li></ul>')
+        self.assertEqual(toc_html([]), "")
+
+
+class TestHeadingAnchors(unittest.TestCase):
+    def test_headings_get_ids_in_the_same_pass(self):
+        toc = TableOfContents()
+        html = markdown_to_html_node("# The **Hobbit**\n\n> ## [Bag End](/shire)\n\n## The Hobbit", toc=toc).to_html()
+        self.assertEqual(
+            html,
+            '<div><h1 id="the-hobbit">The <b>Hobbit</b></h1><blockquote><h2 id="bag-end"><a href="/shire">Bag End'
+            '</a></h2></blockquote><h2 id="the-hobbit-1">The Hobbit</h2></div>',
+        )
+        self.assertEqual(toc.entries, [[1, "the-hobbit", "The Hobbit"], [2, "bag-end", "Bag End"],
+                                       [2, "the-hobbit-1", "The Hobbit"]])
+
+    def test_no_ids_without_toc(self):
+        self.assertEqual(markdown_to_html_node("# Title").to_html(), "<div><h1>Title</h1></div>")
+
+    def test_heading_blocks_are_not_cached(self):
+        saved = utility.block_cache
+        utility.block_cache = BlockCache()
+        try:
+            toc = TableOfContents()
+            html = markdown_to_html_node("## Notes\n\ntext\n\n## Notes\n\ntext", toc=toc).to_html()
+            self.assertEqual(html, '<div><h2 id="notes">Notes</h2><p>text</p><h2 id="notes-1">Notes</h2><p>text</p></div>')
+            self.assertEqual(len(utility.block_cache.entries), 1)
+        finally:
+            utility.block_cache = saved
+
+
+class TestTocPlaceholder(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = self.path("content")
+        self.source = self.write("content/index.md", "# Home\n\n## Intro\n\ntext\n\n## Intro")
+        self.template = self.write("template.html", "<nav>{{ TOC }}</nav>{{ Content }}")
+
+    def test_toc_with_and_without_caches(self):
+        expected = ('<nav><ul><li><a href="#home">Home</a><ul><li><a href="#intro">Intro</a></li><li>'
+                    '<a href="#intro-1">Intro</a></li></ul></li></ul></nav><div><h1 id="home">Home</h1>'
+                    '<h2 id="intro">Intro</h2><p>text</p><h2 id="intro-1">Intro</h2></div>')
+        dest = os.path.join(self.root, "out", "index.html")
+        os.makedirs(os.path.dirname(dest))
+        cache = DiskCache(self.path("cache"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            for page_cache in (None, cache, cache):
+                generate_page(self.source, self.template, dest, "/", cache=page_cache)
+                self.assertEqual(self.read(dest), expected)
+            async_dest = self.path("async")
+            generate_pages_async(self.content, self.template, async_dest, "/", cache=cache)
+        self.assertEqual(self.read(os.path.join(async_dest, "index.html")), expected)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_fragment_missing_one_entry_is_rendered_again(self):
+        dest = os.path.join(self.root, "index.html")
+        cache = DiskCache(self.path("cache"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_page(self.source, self.template, dest, "/", cache=cache)
+            expected = self.read(dest)
+            key = fragment_key(scan_source(self.source)[0], "/")
+            # The content entry holds nothing but the content HTML
+            self.assertEqual(self.read(cache.path(key)), expected[expected.index("<div>"):])
+            for evicted in (key + HEADER_SUFFIX, key):
+                os.remove(cache.path(evicted))
+                generate_page(self.source, self.template, dest, "/", cache=cache)
+                self.assertEqual(self.read(dest), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
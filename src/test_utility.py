@@ -1,6 +1,15 @@
+import contextlib
+import io
+import os
+import re
+import tempfile
+import tracemalloc
 import unittest
 
 from enum import Enum
+import utility
+from cache import BlockCache
+from tempsite import TempSiteTestCase
 from textnode import TextNode, TextType
 from utility import *
 from leafnode import LeafNode
@@ -118,6 +127,38 @@ class TestText(unittest.TestCase):
         self.assertEqual(html_node.props["src"], "https://www.example.com/image.png")  # type: ignore
         self.assertEqual(html_node.props["alt"], "This is an image")  # type: ignore
         
+    def test_link_and_image_basepath(self):
+        link = text_node_to_html_node(TextNode("home", TextType.LINK, "/blog/tom"), "/ss-gen/")
+        self.assertEqual(link.props["href"], "/ss-gen/blog/tom")  # type: ignore
+        image = text_node_to_html_node(TextNode("tom", TextType.IMAGE, "/images/tom.png"), "/ss-gen/")
+        self.assertEqual(image.props["src"], "/ss-gen/images/tom.png")  # type: ignore
+        external = text_node_to_html_node(TextNode("ext", TextType.LINK, "https://www.example.com"), "/ss-gen/")
+        self.assertEqual(external.props["href"], "https://www.example.com")  # type: ignore
+
+    def test_basepath_leaves_code_alone(self):
+        md = "```\n<a href=\"/about\">About</a>\n```\n\n[About](/about)"
+        html = markdown_to_html_node(md, "/ss-gen/").to_html()
+        self.assertEqual(
+            html,
+            '<div><pre><code>&lt;a href="/about"&gt;About&lt;/a&gt;\n</code></pre><p><a href="/ss-gen/about">About</a></p></div>',
+        )
+
+    def test_text_and_attributes_are_escaped(self):
+        md = 'Fish & <chips> [a "b"](/q?x=1&y=2) ![x > y](/i.png)\n\n> 1 < 2\n> **still\n> bold** <br>'
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            '<div><p>Fish &amp; &lt;chips&gt; <a href="/q?x=1&amp;y=2">a "b"</a> <img src="/i.png" alt="x &gt; y"></img></p>'
+            '<blockquote>1 &lt; 2<br><b>still<br>bold</b> &lt;br&gt;</blockquote></div>',
+        )
+
+    def test_character_references_are_kept(self):
+        md = "# Tom &amp; Jerry\n\n&copy; 2024 &mdash; `&copy;` [&lt;home&gt;](/?a=1&amp;b=2)\n\n```\n&amp;\n```"
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            '<div><h1>Tom &amp; Jerry</h1><p>&copy; 2024 &mdash; <code>&amp;copy;</code> '
+            '<a href="/?a=1&amp;b=2">&lt;home&gt;</a></p><pre><code>&amp;amp;\n</code></pre></div>',
+        )
+
     def test_unsupported_text_type(self):
         class FakeTextType(Enum):
             UNSUPPORTED = "unsupported"
@@ -242,7 +283,47 @@ This is the same paragraph on a new line
                 "- This is a list\n- with items",
             ],
         )
-        
+
+    def test_iter_blocks_from_file_lines(self):
+        md = "# Title\n\n\n\nFirst paragraph\nsecond line\n   \n\n- item\n"
+        blocks = list(iter_blocks(io.StringIO(md)))
+        self.assertEqual(blocks, ["# Title", "First paragraph\nsecond line", "- item"])
+        self.assertEqual(blocks, markdown_to_blocks(md))
+
+    def test_iter_file_blocks_matches_text_mode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "page.md")
+            for md in ("# Title\n\n\n\nFirst paragraph\nsecond line\n   \n\n- item\n", "", "\n\n  \n",
+                       "# Windows\r\n\r\nline endings\r\nhere", "# Old Mac\r\rline endings", "# Ünïcode\n\n漢字",
+                       "```\nopen\n\n  ```\n\n```\nnever closed\n\n\nend", "\n\nlead\n\n\n\ntrail\n\n\n",
+                       "- ```\n  code\n\n  ```\n\n> ```\n> a\n\nafter"):
+                with open(path, "w", encoding="utf-8", newline="") as f:
+                    f.write(md)
+                with open(path, encoding="utf-8") as f:
+                    self.assertEqual(list(iter_file_chunks(path)), list(iter_chunks(f)))
+                with open(path, encoding="utf-8") as f:
+                    self.assertEqual(list(iter_file_blocks(path)), list(iter_blocks(f)))
+
+    def test_iter_file_blocks_holds_one_block(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "large.md")
+            block = "A line of a generated paragraph with **bold** text\n" * 20
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join([block] * 4000))
+            tracemalloc.start()
+            try:
+                count = sum(1 for _ in iter_file_blocks(path))
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        self.assertEqual(count, 4000)
+        self.assertLess(peak, 20 * len(block))
+
+    def test_split_title_keeps_earlier_chunks(self):
+        title, chunks = split_title(iter_chunks(io.StringIO("Intro\n\n# Title\n\nBody")))
+        self.assertEqual(title, "Title")
+        self.assertEqual(list(chunks), [("Intro", 1), ("# Title", 1), ("Body", 0)])
+
     def test_block_to_block_type(self):
         self.assertEqual(block_to_block_type("This is a normal paragraph\nwith two lines"), BlockType.PARAGRAPH)
         self.assertEqual(block_to_block_type("# This is a header"), BlockType.HEADING)
@@ -254,7 +335,25 @@ This is the same paragraph on a new line
         self.assertEqual(block_to_block_type("This is a normal paragraph"), BlockType.PARAGRAPH)
         self.assertEqual(block_to_block_type("> This is a blockquote"), BlockType.QUOTE)
         self.assertEqual(block_to_block_type("```\nThis is a code block\n```"), BlockType.CODE)
-        
+
+    def test_block_to_block_type_edge_cases(self):
+        self.assertEqual(block_to_block_type("####### Seven hashes"), BlockType.PARAGRAPH)
+        self.assertEqual(block_to_block_type(" # Indented hash"), BlockType.PARAGRAPH)
+        self.assertEqual(block_to_block_type("  > Indented quote"), BlockType.QUOTE)
+        self.assertEqual(block_to_block_type("12.\tTwelfth"), BlockType.ORDERED_LIST)
+        self.assertEqual(block_to_block_type("1.No space"), BlockType.PARAGRAPH)
+        self.assertEqual(block_to_block_type("-No space"), BlockType.PARAGRAPH)
+        self.assertEqual(block_to_block_type("Text with ``` inline\nand more ```"), BlockType.PARAGRAPH)
+        self.assertEqual(block_to_block_type("Intro\n  ```\ncode\n\t```"), BlockType.CODE)
+        self.assertEqual(block_to_block_type("- item\n" * 5000 + "```"), BlockType.UNORDERED_LIST)
+
+    def test_iter_chunks_counts_empty_lines(self):
+        md = "\n\n  Intro\n\n\n- ```\n  code\n\n\n  ```\n   \n\nend\n"
+        self.assertEqual(list(iter_chunks(md.split("\n"))),
+                         [("  Intro", 2), ("- ```\n  code\n\n\n  ```\n   ", 1), ("end", 1)])
+        self.assertEqual(list(iter_chunks(io.StringIO(md))),
+                         [("  Intro", 2), ("- ```\n  code\n\n\n  ```\n   ", 1), ("end", 0)])
+
     def test_paragraphs(self):
         md = """
 This is **bolded** paragraph
@@ -299,7 +398,9 @@ the **same** even with inline stuff
         html = node.to_html()
         self.assertEqual(
             html,
-            "<div><ul><li>This is a list item with <b>bold</b> text</li><li>This is another item with <code>code</code></li><li>Final item with a <a href=\"https://www.example.com\">link</a></li></ul><p>Code in the middle</p></div>",
+            # The indented line after the empty one is a second paragraph of
+            # the last item, which makes the list loose
+            "<div><ul><li><p>This is a list item with <b>bold</b> text</p></li><li><p>This is another item with <code>code</code></p></li><li><p>Final item with a <a href=\"https://www.example.com\">link</a></p><p>Code in the middle</p></li></ul></div>",
         )  
         
     def test_ordered_list(self):
@@ -316,6 +417,134 @@ the **same** even with inline stuff
             "<div><ol><li>This is a list item with <b>bold</b> text</li><li>This is another item with <code>code</code></li><li>Final item with a <a href=\"https://www.example.com\">link</a></li></ol></div>",
         )
         
+    def test_list_items(self):
+        html = markdown_to_html_node("- a\n  continued\n* b\n+ c\n-\n- d\n-x lazy").to_html()
+        self.assertEqual(html, "<div><ul><li>a\ncontinued</li><li>b</li><li>c</li><li>d\n-x lazy</li></ul></div>")
+        html = markdown_to_html_node("\n".join(f"{i}. item {i}" for i in range(10000))).to_html()
+        self.assertEqual(html.count("<li>"), 10000)
+        self.assertTrue(html.endswith("<li>item 9999</li></ol></div>"))
+
+    def test_nested_lists(self):
+        md = "- a\n  - b\n    1. c\n  - d\n  more d\n- e\n  * f"
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            "<div><ul><li>a<ul><li>b<ol><li>c</li></ol></li><li>d\nmore d</li></ul></li><li>e<ul><li>f</li></ul></li></ul></div>",
+        )
+
+    def test_block_interrupts_paragraph(self):
+        self.assertEqual(
+            markdown_to_html_node("Intro\n- a\n1. b\n# Heading").to_html(),
+            "<div><p>Intro</p><ul><li>a</li></ul><ol><li>b</li></ol><h1>Heading</h1></div>",
+        )
+
+    def test_nested_blockquotes(self):
+        md = "> outer\n> > inner\n> > - item\n>\n> lazy\nline"
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            "<div><blockquote>outer<blockquote>inner<ul><li>item</li></ul></blockquote>lazy<br>line</blockquote></div>",
+        )
+
+    def test_table(self):
+        md = "| Name | Size |   |\n|:-----|-----:|:-:|\n| `a\\|b` | **2** | x \\| y |\n| short |"
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            '<div><table><thead><tr><th align="left">Name</th><th align="right">Size</th><th align="center"></th></tr>'
+            '</thead><tbody><tr><td align="left"><code>a|b</code></td><td align="right"><b>2</b></td>'
+            '<td align="center">x | y</td></tr><tr><td align="left">short</td><td align="right"></td>'
+            '<td align="center"></td></tr></tbody></table></div>',
+        )
+        # Without a matching delimiter row it stays a paragraph
+        self.assertEqual(markdown_to_html_node("| a | b |\n|---|").to_html(), "<div><p>| a | b | |---|</p></div>")
+
+    def test_table_in_list_item(self):
+        md = "- item\n  | a |\n  |---|\n  | 1 |"
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            "<div><ul><li>item<table><thead><tr><th>a</th></tr></thead><tbody><tr><td>1</td></tr></tbody></table></li></ul></div>",
+        )
+
+    def test_fence_with_empty_lines(self):
+        md = "```\nfirst\n\n\nsecond\n```\n\n- item\n  ```\n  x\n\n  y\n  ```\n\nAfter"
+        self.assertEqual(markdown_to_blocks(md)[0], "```\nfirst\n\n\nsecond\n```")
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            "<div><pre><code>first\n\n\nsecond\n</code></pre><ul><li>item<pre><code>x\n\ny\n</code></pre></li></ul><p>After</p></div>",
+        )
+
+    def test_fence_opened_by_list_item(self):
+        md = "- ```\n  code\n\n  more\n  ```"
+        self.assertEqual(markdown_to_html_node(md).to_html(), "<div><ul><li><pre><code>code\n\nmore\n</code></pre></li></ul></div>")
+        md = "1. ```py\n   x = 1\n\n\n   y = 2\n   ```\n\n> ```\n> a\n\nafter"
+        self.assertEqual(
+            markdown_to_html_node(md).to_html(),
+            '<div><ol><li><pre><code class="language-py">x = <span class="tok-number">1</span>\n\n\ny = '
+            '<span class="tok-number">2</span>\n</code></pre></li></ol><blockquote><pre><code>a\n</code></pre>'
+            '</blockquote><p>after</p></div>',
+        )
+
+    def test_unclosed_fence_ends_at_its_last_line(self):
+        for md in ("```\ncode", "```\ncode\n", "```\ncode\n\n\n", "```\ncode\n  \n"):
+            self.assertEqual(markdown_to_html_node(md).to_html(), "<div><pre><code>code\n</code></pre></div>")
+        self.assertEqual(markdown_to_html_node("```\na\n\nb\n\n").to_html(), "<div><pre><code>a\n\nb\n</code></pre></div>")
+        self.assertEqual(markdown_to_html_node("- x\n  ```\n  a\n").to_html(),
+                         "<div><ul><li>x<pre><code>a\n</code></pre></li></ul></div>")
+
+    def test_nesting_is_capped(self):
+        # Deeper markers stay as text instead of overflowing the stack when
+        # the nodes are serialized
+        md = "\n".join("  " * i + "- x" for i in range(600))
+        html = markdown_to_html_node(md).to_html()
+        self.assertEqual(html.count("<ul>"), (utility.MAX_NESTING - 1) // 2)
+        self.assertEqual(html.count("- x"), 600 - html.count("<ul>"))
+        html = markdown_to_html_node(">" * 1000 + " x").to_html()
+        self.assertEqual(html.count("<blockquote>"), utility.MAX_NESTING - 2)
+        self.assertIn("&gt;" * (1000 - html.count("<blockquote>")) + " x</blockquote>", html)
+
+    def test_loose_lists(self):
+        self.assertEqual(markdown_to_html_node("- a\n\n- b").to_html(), "<div><ul><li><p>a</p></li><li><p>b</p></li></ul></div>")
+        self.assertEqual(
+            markdown_to_html_node("1. a\n\n   second\n2. b").to_html(),
+            "<div><ol><li><p>a</p><p>second</p></li><li><p>b</p></li></ol></div>",
+        )
+        self.assertEqual(markdown_to_html_node("- a\n- b\n\nafter").to_html(), "<div><ul><li>a</li><li>b</li></ul><p>after</p></div>")
+        self.assertEqual(
+            markdown_to_html_node("- a\n  - b\n\n  - c").to_html(),
+            "<div><ul><li>a<ul><li><p>b</p></li><li><p>c</p></li></ul></li></ul></div>",
+        )
+
+    def test_block_cache_keeps_lists_that_end_with_their_chunk(self):
+        saved = utility.block_cache
+        utility.block_cache = BlockCache()
+        try:
+            # A chunk is only looked up or stored when nothing is open before
+            # it. One ending in a list is stored, or used, once the next chunk
+            # shows the list doesn't go on
+            self.assertEqual(markdown_to_html_node("- a\n\nx\n\nx").to_html(),
+                             "<div><ul><li>a</li></ul><p>x</p><p>x</p></div>")
+            self.assertEqual([block for _, block in utility.block_cache.entries], ["- a", "x"])
+            self.assertEqual((utility.block_cache.hits, utility.block_cache.misses), (1, 2))
+            # Here it does, so the cached tight list can't be used
+            self.assertEqual(markdown_to_html_node("- a\n\n- b\n\nx").to_html(),
+                             "<div><ul><li><p>a</p></li><li><p>b</p></li></ul><p>x</p></div>")
+            self.assertEqual((utility.block_cache.hits, utility.block_cache.misses), (1, 3))
+            self.assertEqual(markdown_to_html_node("- a\n\n  b").to_html(),
+                             "<div><ul><li><p>a</p><p>b</p></li></ul></div>")
+            self.assertEqual((utility.block_cache.hits, utility.block_cache.misses), (1, 4))
+            self.assertEqual(markdown_to_html_node("- a\n\nx").to_html(), "<div><ul><li>a</li></ul><p>x</p></div>")
+            self.assertEqual(markdown_to_html_node("- a").to_html(), "<div><ul><li>a</li></ul></div>")
+            self.assertEqual((utility.block_cache.hits, utility.block_cache.misses), (4, 4))
+        finally:
+            utility.block_cache = saved
+
+    def test_block_parser_lines(self):
+        parser = BlockParser()
+        for line in ["# Title", "", "> quote", "> ```", "> code", "> ```", "- item", "", "text"]:
+            parser.feed(line)
+        self.assertEqual(
+            "".join(node.to_html() for node in parser.close()),
+            "<h1>Title</h1><blockquote>quote<pre><code>code\n</code></pre></blockquote><ul><li>item</li></ul><p>text</p>",
+        )
+
     def test_blockquote(self):
         md = """
 > This is a blockquote
@@ -375,6 +604,7 @@ Some content here.
 """
         title = extract_title(md)
         self.assertEqual(title, "This is a title")
+        self.assertEqual(extract_title("# Title\nand a paragraph"), "Title")
         md2 = """
 Some content here without a title.
 """
@@ -382,4 +612,124 @@ Some content here without a title.
         md3 = """
 ## This is a level 2 heading
 """
-        self.assertRaises(ValueError, extract_title, md3)
\ No newline at end of file
+        self.assertRaises(ValueError, extract_title, md3)
+
+
+class TestInlineScanner(unittest.TestCase):
+    def chained(self, text):
+        nodes = [TextNode(text)]
+        nodes = split_nodes_image(nodes)
+        nodes = split_nodes_link(nodes)
+        nodes = split_nodes_delimiter(nodes, "**", TextType.BOLD)
+        nodes = split_nodes_delimiter(nodes, "_", TextType.ITALIC)
+        nodes = split_nodes_delimiter(nodes, "`", TextType.CODE)
+        return nodes
+
+    def test_matches_chained_passes(self):
+        samples = [
+            "",
+            "plain text",
+            "**bold** then _italic_ then `code`",
+            "****empty bold",
+            "**a _b_ c**",
+            "a [link](https://x.com) and ![img](https://x.com/i.png) and [two](/b)",
+            "![first](a.png)![second](b.png)",
+            "text with [**bold link**](/x) and **bold** [link](/y)",
+            "image ![alt _with_ marks](/i.png) then _italic_",
+            "**bold**<br>_italic_<br>`code`",
+        ]
+        for text in samples:
+            self.assertEqual(text_to_textnodes(text), self.chained(text), text)
+
+    def test_links_and_images_match_the_patterns(self):
+        samples = [
+            "![a](b) ![](c) ![d]() ![e](f\ng)",
+            "![a](b](c)) ![x]](y)",
+            "[a](b) [](c) [d]() [e]f(g) [h[i](j) ![k](l\nm)",
+            "[a\nb](c\nd) [x](y",
+        ]
+        for text in samples:
+            self.assertEqual(extract_markdown_images(text), re.findall(r"!\[(.*?)\]\((.*?)\)", text), text)
+            self.assertEqual(extract_markdown_links(text), re.findall(r"(?<!\!)\[([^\]]+)\]\(([^)]+)\)", text), text)
+
+    def test_unclosed_links_and_images_are_linear(self):
+        # Each took seconds to minutes with the backtracking regexes
+        for opener in ("![a](", "[a](", "![a]", "[a]"):
+            text = opener * 20000
+            self.assertEqual(text_to_textnodes(text), [TextNode(text)])
+        self.assertEqual(len(text_to_textnodes("![a](" * 20000 + ")")), 1)
+
+    def test_unmatched_delimiter(self):
+        for text in ["**bold", "an _italic", "a `code", "_a **b** c_", "[link](/x) and **bold"]:
+            with self.assertRaises(ValueError):
+                text_to_textnodes(text)
+
+
+class TestGeneratePages(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = self.path("content")
+        self.template = self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.write("content/index.md", "# Home\n\nWelcome")
+        self.write("content/blog/b/index.md", "# B\n\nSecond")
+        self.write("content/blog/a/index.md", "# A\n\nFirst")
+        self.write("content/broken/index.md", "No title here")
+
+    def build(self, dest, jobs):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            failures = generate_pages_recursive(self.content, self.template, dest, "/", jobs=jobs)
+        return failures, out.getvalue()
+
+    def test_find_pages_is_sorted(self):
+        dest = os.path.join(self.root, "out")
+        pages = find_pages(self.content, dest)
+        self.assertEqual(
+            [os.path.relpath(src, self.content) for src, _ in pages],
+            ["blog/a/index.md", "blog/b/index.md", "broken/index.md", "index.md"],
+        )
+        self.assertEqual(pages[0][1], os.path.join(dest, "blog", "a", "index.html"))
+
+    def test_parallel_matches_serial(self):
+        serial_dest = os.path.join(self.root, "serial")
+        parallel_dest = os.path.join(self.root, "parallel")
+        serial_failures, serial_log = self.build(serial_dest, 1)
+        parallel_failures, parallel_log = self.build(parallel_dest, 3)
+        self.assertEqual(self.read_tree(serial_dest), self.read_tree(parallel_dest))
+        self.assertEqual(serial_failures, parallel_failures)
+        self.assertEqual(serial_log.replace(serial_dest, ""), parallel_log.replace(parallel_dest, ""))
+
+    def test_generated_page(self):
+        dest = os.path.join(self.root, "out")
+        self.write("content/index.md", "Intro [home](/) text\n\n# Home\n\n![logo](/logo.png)")
+        os.makedirs(dest)
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_page(os.path.join(self.content, "index.md"), self.template, os.path.join(dest, "index.html"), "/base/")
+        self.assertEqual(
+            self.read("out/index.html"),
+            '<title>Home</title><div><p>Intro <a href="/base/">home</a> text</p><h1 id="home">Home</h1><p><img src="/base/logo.png" alt="logo"></img></p></div>',
+        )
+
+    def test_identical_pages_are_not_rewritten(self):
+        dest = os.path.join(self.root, "out")
+        self.build(dest, 1)
+        home = os.path.join(dest, "index.html")
+        os.utime(home, (1000, 1000))
+        for jobs in (1, 2):
+            page_counts.clear()
+            self.build(dest, jobs)
+            self.assertEqual(page_counts, {"unchanged": 3})
+            self.assertEqual(os.stat(home).st_mtime, 1000)
+        self.write("content/index.md", "# Home\n\nWelcome back")
+        page_counts.clear()
+        self.build(dest, 2)
+        self.assertEqual(page_counts, {"written": 1, "unchanged": 2})
+
+    def test_failed_page_does_not_stop_build(self):
+        dest = os.path.join(self.root, "out")
+        failures, _ = self.build(dest, 2)
+        self.assertEqual(len(failures), 1)
+        self.assertTrue(failures[0][0].endswith(os.path.join("broken", "index.md")))
+        self.assertIn("ValueError", failures[0][1])
+        self.assertTrue(os.path.exists(os.path.join(dest, "index.html")))
+        self.assertTrue(os.path.exists(os.path.join(dest, "blog", "b", "index.html")))
@@ -0,0 +1,118 @@
+import contextlib
+import io
+import os
+import unittest
+
+from tempsite import TempSiteTestCase
+from watch import InotifyWatcher, PollingWatcher, SiteBuilder, inject_livereload
+
+
+class TestWatchers(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = self.path("content")
+        os.makedirs(self.dir)
+        self.single = self.write("template.html", "{{ Content }}")
+
+    def check_watcher(self, watcher):
+        try:
+            page = os.path.join(self.dir, "index.md")
+            self.write(page, "# Hi")
+            self.assertIn(page, watcher.poll(1.0) | watcher.poll(0.2))
+            self.write("unrelated.txt", "x")
+            self.write(self.single, "<main>{{ Content }}</main>")
+            self.assertEqual(watcher.poll(1.0) | watcher.poll(0.2), {self.single})
+            os.makedirs(os.path.join(self.dir, "blog"))
+            nested = os.path.join(self.dir, "blog", "post.md")
+            self.write(nested, "# Post")
+            self.assertIn(nested, watcher.poll(1.0) | watcher.poll(0.2))
+            os.remove(page)
+            self.assertIn(page, watcher.poll(1.0) | watcher.poll(0.2))
+        finally:
+            watcher.close()
+
+    def test_polling_watcher(self):
+        self.check_watcher(PollingWatcher([self.dir, self.single], interval=0.05))
+
+    def test_inotify_watcher(self):
+        try:
+            watcher = InotifyWatcher([self.dir, self.single])
+        except OSError:
+            self.skipTest("inotify is not available")
+        self.check_watcher(watcher)
+
+
+class TestSiteBuilder(TempSiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write("content/index.md", "# Home")
+        self.write("content/blog/post/index.md", "# Post\n\n![Tom](/images/tom.png)")
+        self.write("static/images/tom.png", "png")
+        self.write("static/index.css", "body {}")
+        self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.builder = SiteBuilder(
+            content_dir=self.path("content"),
+            template_path=self.path("template.html"),
+            static_dir=self.path("static"),
+            output_dir=self.path("docs"),
+            manifest_path=self.path("manifest.json"),
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.builder.full_build()
+
+    def rebuild(self, *rel_paths):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.builder.rebuild({self.path(p) for p in rel_paths})
+        return out.getvalue()
+
+    def test_edit_rebuilds_only_that_page(self):
+        self.write("content/index.md", "# Welcome")
+        log = self.rebuild("content/index.md")
+        self.assertEqual(self.read("docs/index.html"), '<title>Welcome</title><div><h1 id="welcome">Welcome</h1></div>')
+        self.assertNotIn("post", log)
+
+    def test_template_change_rebuilds_pages(self):
+        self.write("template.html", "<h1>{{ Title }}</h1>")
+        self.rebuild("template.html")
+        self.assertEqual(self.read("docs/index.html"), "<h1>Home</h1>")
+        self.assertEqual(self.read("docs/blog/post/index.html"), "<h1>Post</h1>")
+
+    def test_deleted_directory_template_rebuilds_its_pages(self):
+        self.write("content/blog/template.html", "<h1>{{ Title }}</h1>")
+        self.rebuild("content/blog/template.html")
+        self.assertEqual(self.read("docs/blog/post/index.html"), "<h1>Post</h1>")
+        os.remove(self.path("content/blog/template.html"))
+        log = self.rebuild("content/blog/template.html")
+        self.assertTrue(self.read("docs/blog/post/index.html").startswith("<title>Post</title>"))
+        self.assertNotIn(self.path("content/index.md"), log)
+
+    def test_asset_change_rebuilds_pages_linking_to_it(self):
+        self.write("static/images/tom.png", "new png")
+        log = self.rebuild("static/images/tom.png")
+        self.assertEqual(self.read("docs/images/tom.png"), "new png")
+        self.assertIn("Generating page from " + self.path("content/blog/post/index.md"), log)
+        self.assertNotIn(self.path("content/index.md"), log)
+
+    def test_deleted_page_and_asset_are_removed(self):
+        os.remove(self.path("content/blog/post/index.md"))
+        os.remove(self.path("static/index.css"))
+        self.rebuild("content/blog/post/index.md", "static/index.css")
+        self.assertFalse(os.path.exists(self.path("docs/blog/post/index.html")))
+        self.assertFalse(os.path.exists(self.path("docs/index.css")))
+
+    def test_changed_asset_is_copied(self):
+        self.write("static/images/new.png", "png")
+        self.rebuild("static/images/new.png")
+        self.assertEqual(self.read("docs/images/new.png"), "png")
+
+
+class TestLiveReload(unittest.TestCase):
+    def test_inject_before_body_end(self):
+        html = inject_livereload(b"<html><body><p>x</p></body></html>")
+        self.assertTrue(html.startswith(b"<html><body><p>x</p><script>"))
+        self.assertTrue(html.endswith(b"</script></body></html>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Heading anchors and the table of contents of a page.
+
+The block parser hands every heading it renders to the page's
+TableOfContents, which gives it a unique id. The entries come out in page
+order as the content is rendered, so the {{ TOC }} slot of a template is
+filled without going over the HTML again.
+"""
+import re
+
+from leafnode import LeafNode
+from parentnode import ParentNode
+
+SLUG_STRIP = re.compile(r"[^\w\- ]")
+
+
+def slugify(text):
+    # GitHub style: lower case, punctuation dropped, spaces to hyphens
+    return SLUG_STRIP.sub("", text.strip().lower()).replace(" ", "-") or "section"
+
+
+class TableOfContents:
+    """The headings of one page, as [level, id, text] entries.
+
+    Repeated slugs get -1, -2, ... appended, skipping any that an earlier
+    heading already took.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.ids = set()
+
+    def add(self, level, text):
+        # Returns the id for the heading
+        slug = base = slugify(text)
+        n = 1
+        while slug in self.ids:
+            slug = f"{base}-{n}"
+            n += 1
+        self.ids.add(slug)
+        self.entries.append([level, slug, text])
+        return slug
+
+
+def toc_to_html_node(entries):
+    # Nested lists following the heading levels. A heading deeper than the
+    # one before it goes in a sublist of that heading's item.
+    root = []
+    stack = [(0, root)]
+    for level, slug, text in entries:
+        while len(stack) > 1 and stack[-1][0] >= level:
+            stack.pop()
+        children = []
+        stack[-1][1].append((slug, text, children))
+        stack.append((level, children))
+    return _toc_list(root) if root else None
+
+
+def _toc_list(items):
+    return ParentNode("ul", [
+        ParentNode("li", [LeafNode("a", text, {"href": f"#{slug}"})] + ([_toc_list(children)] if children else []))
+        for slug, text, children in items
+    ])
+
+
+def toc_html(entries):
+    node = toc_to_html_node(entries)
+    return node.to_html() if node is not None else ""
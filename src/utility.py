@@ -1,10 +1,31 @@
+import collections
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import mmap
 import re
 import os
+import shutil
 
+from concurrent.futures import ProcessPoolExecutor
+
+import console
+from cache import BlockCache, fragment_key
+from console import info
+from htmlnode import escape_text
 from leafnode import LeafNode
+from manifest import scan_source
 from parentnode import ParentNode
+from rawnode import RawNode
+from stats import NULL_TIMER, PageTimer
+from sync import AtomicFile
+from template import find_template, load_template
 from textnode import TextNode, TextType
+from toc import TableOfContents, toc_html
 from enum import Enum
+import highlight
 
 
 class BlockType(Enum):
@@ -15,25 +36,63 @@ class BlockType(Enum):
     CODE = "c"
     QUOTE = "q"
 
+FENCE_LINE_PATTERN = re.compile(r"^[^\S\n]*```", re.MULTILINE)
+HEADING_PATTERN = re.compile(r"#{1,6} ")
+ORDERED_ITEM_PATTERN = re.compile(r"\d+\.\s")
+UNORDERED_ITEM_PATTERN = re.compile(r"[-*+]\s")
+# A line that opens or closes a code fence, maybe inside a quote or a list
+# item. The chunk splitters only go by this to keep fences with empty lines
+# in one chunk; the block parser decides where fences really end.
+FENCE_LINE = re.compile(r"[ \t]*(?:(?:>|(?:[-*+]|\d+\.)[ \t])[ \t]*)*```")
+FENCE_LINE_BYTES = re.compile(rb"^[ \t]*(?:(?:>|(?:[-*+]|\d+\.)[ \t])[ \t]*)*```", re.MULTILINE)
+NEWLINE = ord("\n")
+
+
+def is_fence_line(line):
+    # Opens or closes a code fence, once the markers of the blocks it is in
+    # are taken off
+    return line.lstrip(" \t").startswith("```")
+
+
+def _has_code_fences(block):
+    # A block is code as soon as two of its lines open with ```, whatever else
+    # it holds. Most blocks have no ``` at all, and the scan stops at the
+    # second fence line instead of walking every line of a long fence.
+    start = block.find("```")
+    if start == -1:
+        return False
+    fences = FENCE_LINE_PATTERN.finditer(block, block.rfind("\n", 0, start) + 1)
+    return next(fences, None) is not None and next(fences, None) is not None
+
+
 def block_to_block_type(block):
-    lines = block.split("\n")
-    first_line = lines[0].strip()
-    first_fence = next((i for i,l in enumerate(lines) if l.strip().startswith("```")), None)
-    last_fence  = next((i for i in range(len(lines)-1, -1, -1) if lines[i].strip().startswith("```")), None)
-    if first_fence is not None and last_fence is not None and last_fence > first_fence:
+    # The type of a block from markdown_to_blocks, judged by its first
+    # characters. Page rendering doesn't need it, since BlockParser works
+    # the structure out line by line, but it is kept for callers that only
+    # want to classify blocks.
+    if _has_code_fences(block):
         return BlockType.CODE
-    if block.startswith(("# ", "## ", "### ", "#### ", "##### ", "###### ")):
+    if block[:1] == "#" and HEADING_PATTERN.match(block):
         return BlockType.HEADING
-    elif first_line.startswith(">"):
+    end = block.find("\n")
+    first_line = (block if end == -1 else block[:end]).strip()
+    first = first_line[:1]
+    if first == ">":
         return BlockType.QUOTE
-    elif re.match(r"^\d+\.\s", first_line):
+    elif first.isdigit() and ORDERED_ITEM_PATTERN.match(first_line):
         return BlockType.ORDERED_LIST
-    elif re.match(r"^[-*+]\s", first_line):
+    elif first in ("-", "*", "+") and UNORDERED_ITEM_PATTERN.match(first_line):
         return BlockType.UNORDERED_LIST
     else:
         return BlockType.PARAGRAPH
 
-def text_node_to_html_node(text_node):
+def apply_basepath(url, basepath):
+    # Root-relative URLs are served from under the site's basepath
+    if basepath != "/" and url.startswith("/"):
+        return basepath + url[1:]
+    return url
+
+def text_node_to_html_node(text_node, basepath="/"):
         match text_node.text_type:
             case TextType.TEXT:
                 return LeafNode(None, text_node.text)
@@ -41,9 +100,9 @@ def text_node_to_html_node(text_node):
                 tag = text_node.text_type.value
                 return LeafNode(tag, text_node.text)
             case TextType.LINK:
-                return LeafNode("a", text_node.text, {"href": text_node.url})
+                return LeafNode("a", text_node.text, {"href": apply_basepath(text_node.url, basepath)})
             case TextType.IMAGE:
-                return LeafNode("img", "", {"src": text_node.url, "alt": text_node.text})
+                return LeafNode("img", "", {"src": apply_basepath(text_node.url, basepath), "alt": text_node.text})
             case _:
                 raise ValueError(f"Unsupported text type: {text_node.text_type}")
 
@@ -64,17 +123,63 @@ def split_nodes_delimiter(old_nodes, delimiter, text_type):
             result.append(node)
     return result
 
+def _iter_images(text, start, end):
+    # Yields (start, end, alt, url) for each ![alt](url) in text[start:end],
+    # the matches of !\[(.*?)\]\((.*?)\) found with str.find. Alt is up to the
+    # first ]( and url up to the first ) after it, both on the same line. If
+    # an image can't be closed, neither can any later one on that line, so
+    # the search goes on from the next line and stays linear.
+    pos = start
+    while True:
+        i = text.find("![", pos, end)
+        if i == -1:
+            return
+        line_end = text.find("\n", i, end)
+        if line_end == -1:
+            line_end = end
+        j = text.find("](", i + 2, line_end)
+        k = text.find(")", j + 2, line_end) if j != -1 else -1
+        if k == -1:
+            pos = line_end
+            continue
+        yield i, k + 1, text[i + 2:j], text[j + 2:k]
+        pos = k + 1
+
+def _iter_links(text, start, end):
+    # Yields (start, end, text, url) for each [text](url) in text[start:end]
+    # not preceded by !, the matches of (?<!!)\[([^\]]+)\]\(([^)]+)\) found
+    # with str.find. The text runs to the first ] and the url to the first )
+    # after it, so each failed [ is skipped past what it already searched.
+    pos = start
+    while True:
+        i = text.find("[", pos, end)
+        if i == -1:
+            return
+        if i > 0 and text[i - 1] == "!":
+            pos = i + 1
+            continue
+        j = text.find("]", i + 1, end)
+        if j == -1:
+            # No later [ has a ] to close it either
+            return
+        if j == i + 1 or j + 1 >= end or text[j + 1] != "(":
+            # Every [ before this ] would stop at it too
+            pos = j if j > i + 1 else i + 1
+            continue
+        k = text.find(")", j + 2, end)
+        if k == -1:
+            return
+        if k == j + 2:
+            pos = j
+            continue
+        yield i, k + 1, text[i + 1:j], text[j + 2:k]
+        pos = k + 1
+
 def extract_markdown_images(text):
-    matches = re.findall(r"!\[(.*?)\]\((.*?)\)", text)
-    images = []
-    for alt, url in matches:
-        images.append((alt, url))
-    return images
+    return [(alt, url) for _, _, alt, url in _iter_images(text, 0, len(text))]
 
 def extract_markdown_links(text):
-    matches = re.findall(r"(?<!\!)\[([^\]]+)\]\(([^)]+)\)", text)
-    links = [(alt, url) for alt, url in matches]
-    return links
+    return [(alt, url) for _, _, alt, url in _iter_links(text, 0, len(text))]
 
 def split_nodes_image(old_nodes):
     result = []
@@ -115,134 +220,926 @@ def split_nodes_link(old_nodes):
             result.append(node)
     return result
 
+# Applied in this order, each one only to the plain text left by the ones before
+INLINE_DELIMITERS = (("**", TextType.BOLD), ("_", TextType.ITALIC), ("`", TextType.CODE))
+
+
+def _scan_delimited(text, start, end, level, nodes):
+    if level == len(INLINE_DELIMITERS):
+        if start < end:
+            nodes.append(TextNode(text[start:end]))
+        return
+    delimiter, text_type = INLINE_DELIMITERS[level]
+    pos = start
+    inside = False
+    while True:
+        i = text.find(delimiter, pos, end)
+        if i == -1:
+            break
+        if inside:
+            nodes.append(TextNode(text[pos:i], text_type))
+        else:
+            _scan_delimited(text, pos, i, level + 1, nodes)
+        inside = not inside
+        pos = i + len(delimiter)
+    if inside:
+        raise ValueError(f"Unmatched delimiter: {delimiter}")
+    _scan_delimited(text, pos, end, level + 1, nodes)
+
+
+def _scan_links(text, start, end, nodes):
+    pos = start
+    for link_start, link_end, link_text, url in _iter_links(text, start, end):
+        _scan_delimited(text, pos, link_start, 0, nodes)
+        nodes.append(TextNode(link_text, TextType.LINK, url))
+        pos = link_end
+    _scan_delimited(text, pos, end, 0, nodes)
+
+
 def text_to_textnodes(text):
-    nodes = [TextNode(text)]
-    nodes = split_nodes_image(nodes)
-    nodes = split_nodes_link(nodes)
-    nodes = split_nodes_delimiter(nodes, "**", TextType.BOLD)
-    nodes = split_nodes_delimiter(nodes, "_", TextType.ITALIC)
-    nodes = split_nodes_delimiter(nodes, "`", TextType.CODE)
+    # Works on (start, end) ranges of the original string and appends straight
+    # to one list, so no intermediate node lists or substrings are built. The
+    # result is the same as running split_nodes_image, split_nodes_link and
+    # split_nodes_delimiter for **, _ and ` one after another.
+    nodes = []
+    pos = 0
+    for image_start, image_end, alt, url in _iter_images(text, 0, len(text)):
+        _scan_links(text, pos, image_start, nodes)
+        nodes.append(TextNode(alt, TextType.IMAGE, url))
+        pos = image_end
+    _scan_links(text, pos, len(text), nodes)
     return nodes
 
-def markdown_to_blocks(markdown):
-    blocks = markdown.split("\n\n")
-    filtered_blocks = []
-    for block in blocks:
-        if block.strip() == "":
+def iter_chunks(lines):
+    """Yields the chunks of markdown between empty lines, and the number of
+    empty lines after each.
+
+    Takes any iterable of lines, with or without their trailing newline (a
+    list from str.split("\n") or an open file), and only ever holds the
+    lines of the current chunk. Empty lines inside a code fence stay in its
+    chunk. Only the last chunk can be followed by no empty line.
+    """
+    chunk = []
+    blank_lines = 0
+    in_fence = False
+    for line in lines:
+        if line.endswith("\n"):
+            line = line[:-1]
+        if not line and not in_fence:
+            if chunk:
+                blank_lines += 1
             continue
-        block = block.strip()
-        filtered_blocks.append(block)
-    return filtered_blocks
-
-def markdown_to_html_node(markdown):
-    blocks = markdown_to_blocks(markdown)
-    if not blocks:
-        return ParentNode("div", [])
-    html_nodes = []
-    for block in blocks:
-        block_type = block_to_block_type(block)
-        match block_type:
-            case BlockType.PARAGRAPH:
-                lines = [line.strip() for line in block.split("\n")]
-                block = " ".join(lines)
-                text_nodes = text_to_textnodes(block)
-                children = [text_node_to_html_node(tn) for tn in text_nodes]
-                html_nodes.append(ParentNode("p", children=children))
-            case BlockType.HEADING:
-                line = block.lstrip()
-                level = len(line) - len(line.lstrip("#"))
-                if level > 6:
-                    level = 6
-                content = line[level:].strip()
-                text_nodes = text_to_textnodes(content)
-                children = [text_node_to_html_node(tn) for tn in text_nodes]
-                html_nodes.append(ParentNode(f"h{level}", children=children))
-            case BlockType.ORDERED_LIST:
-                norm = "\n".join(l.lstrip() for l in block.splitlines() if l.strip() != "")
-                items = re.findall(r"^\d+\.\s+(.*?)(?=\n\d+\.|\Z)", norm, re.DOTALL | re.MULTILINE)
-
-                list_items = []
-                for item in items:
-                    text = item.strip()
-                    if not text:
-                        continue
-                    text_nodes = text_to_textnodes(text)
-                    children = [text_node_to_html_node(tn) for tn in text_nodes]
-                    list_items.append(ParentNode("li", children=children))
-
-                if list_items:
-                    html_nodes.append(ParentNode("ol", children=list_items))
-            case BlockType.UNORDERED_LIST:
-                norm = "\n".join(l.lstrip() for l in block.splitlines() if l.strip() != "")
-                items = re.findall(r"^[-*+]\s+(.*?)(?=\n[-*+]\s|\Z)", norm, re.DOTALL | re.MULTILINE)
-                list_items = []
-                for item in items:
-                    text_nodes = text_to_textnodes(item.strip())
-                    children = [text_node_to_html_node(tn) for tn in text_nodes]
-                    list_items.append(ParentNode("li", children=children))
-                html_nodes.append(ParentNode("ul", children=list_items))
-            case BlockType.CODE:
-                raw = block.split("\n")
-                inner = raw[1:-1]
-                non_empty = [line for line in inner if line.strip() != ""]
-                if non_empty:
-                    min_indent = min(len(l) - len(l.lstrip(" ")) for l in non_empty)
-                    inner = [l[min_indent:] if len(l) >= min_indent else "" for l in inner]
-                code_content = "\n".join(inner)
-                if not code_content.endswith("\n"):
-                    code_content += "\n"
-                code_text_node = TextNode(code_content, TextType.CODE)
-                html_nodes.append(ParentNode("pre", children=[text_node_to_html_node(code_text_node)]))
-            case BlockType.QUOTE:
-                lines = []
-                for ln in block.splitlines():
-                    if ln.lstrip().startswith(">"):
-                        # remove exactly one leading '>' and optional following space
-                        s = ln.lstrip()[1:]
-                        if s.startswith(" "):
-                            s = s[1:]
-                        lines.append(s.rstrip())
-                quote_content = "<br>".join(lines)
-                text_nodes = text_to_textnodes(quote_content)
-                children = [text_node_to_html_node(tn) for tn in text_nodes]
-                html_nodes.append(ParentNode("blockquote", children=children))
-    return ParentNode("div", children=html_nodes)
+        if blank_lines:
+            yield "\n".join(chunk), blank_lines
+            chunk = []
+            blank_lines = 0
+        chunk.append(line)
+        if "```" in line and FENCE_LINE.match(line):
+            in_fence = not in_fence
+    if chunk:
+        yield "\n".join(chunk), blank_lines
 
-def extract_title(markdown):
-    blocks = markdown_to_blocks(markdown)
-    for block in blocks:
-        if block.startswith("# "):
-            return block[2:].strip()
+def iter_blocks(lines):
+    # The chunks of iter_chunks with surrounding whitespace taken off, and
+    # the blank ones left out
+    for text, _ in iter_chunks(lines):
+        text = text.strip()
+        if text:
+            yield text
+
+def _count_fences(buf, start, end):
+    # The fence lines of buf[start:end], as FENCE_LINE sees them
+    if buf.find(b"```", start, end) == -1:
+        return 0
+    return sum(1 for _ in FENCE_LINE_BYTES.finditer(buf, start, end))
+
+def iter_file_chunks(path, timer=NULL_TIMER):
+    # The same chunks as iter_chunks(open(path)), but the empty lines
+    # between chunks are found by searching a memory map of the file, and
+    # only the chunk being yielded is ever decoded, so no line or whole-file
+    # copies are made. Mapping the file, searching it and decoding, where
+    # its pages are faulted in, count as the "read" stage of timer.
+    with timer.stage("read"):
+        with open(path, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                return
+        crlf = buf.find(b"\r") != -1
+    with buf:
+        if crlf:
+            # Windows or old Mac line endings: let text mode translate them
+            with timer.stage("read"), open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            yield from iter_chunks(text.split("\n"))
+            return
+        size = len(buf)
+        pos = 0
+        while pos < size and buf[pos] == NEWLINE:
+            pos += 1
+        while pos < size:
+            with timer.stage("read"):
+                end = buf.find(b"\n\n", pos)
+            if end == -1:
+                end = size
+            # An odd number of fence lines leaves a fence open, and the
+            # chunk runs on past the empty line to the one that closes it
+            fences = _count_fences(buf, pos, end)
+            while fences % 2 and end < size:
+                start = end
+                end = buf.find(b"\n\n", end + 1)
+                if end == -1:
+                    end = size
+                fences += _count_fences(buf, start, end)
+            next_pos = end
+            while next_pos < size and buf[next_pos] == NEWLINE:
+                next_pos += 1
+            if end == size and buf[end - 1] == NEWLINE:
+                # The newline ending the last line
+                end -= 1
+            with timer.stage("read"):
+                text = buf[pos:end].decode("utf-8")
+            yield text, max(next_pos - end - 1, 0)
+            pos = next_pos
+
+def iter_file_blocks(path):
+    for text, _ in iter_file_chunks(path):
+        text = text.strip()
+        if text:
+            yield text
+
+def markdown_to_blocks(markdown):
+    return list(iter_blocks(markdown.split("\n")))
+
+# Indentation, and the marker that opens a list item with the spaces after it
+INDENT = re.compile(r"[ \t]*")
+LIST_MARKER = re.compile(r"(?:[-*+]|\d+\.)(?:[ \t]+|$)")
+LIST_MARKER_FIRST = frozenset("-*+0123456789")
+TABLE_ALIGNMENT = re.compile(r":?-+:?")
+TABLE_CELL_SEPARATOR = re.compile(r"(?<!\\)\|")
+
+def _table_cells(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in TABLE_CELL_SEPARATOR.split(line)]
+
+def _table_alignments(line):
+    # The alignment of each column if line is the delimiter row under a
+    # table's header, like "| :-- | :-: | --: |", otherwise None
+    if "|" not in line:
+        return None
+    alignments = []
+    for cell in _table_cells(line):
+        if not TABLE_ALIGNMENT.fullmatch(cell):
+            return None
+        if cell[0] == ":":
+            alignments.append("center" if cell[-1] == ":" else "left")
+        else:
+            alignments.append("right" if cell[-1] == ":" else None)
+    return alignments
+
+# Joins the lines of a quote for inline parsing. Like the <br> it turns into,
+# it is a single-line character no inline pattern treats specially, but
+# unlike it, it can't be confused with markup in the text.
+LINE_BREAK = "\0"
+BR = RawNode("<br>")
+
+def _with_line_breaks(text_nodes, basepath):
+    children = []
+    for text_node in text_nodes:
+        if LINE_BREAK not in text_node.text:
+            children.append(text_node_to_html_node(text_node, basepath))
+        elif text_node.text_type == TextType.IMAGE:
+            alt = text_node.text.replace(LINE_BREAK, " ")
+            children.append(text_node_to_html_node(TextNode(alt, TextType.IMAGE, text_node.url), basepath))
+        else:
+            parts = []
+            for i, line in enumerate(text_node.text.split(LINE_BREAK)):
+                if i:
+                    parts.append(BR)
+                if line:
+                    parts.append(LeafNode(None, line))
+            node = text_node_to_html_node(text_node, basepath)
+            if node.tag is None:
+                children.extend(parts)
+            else:
+                children.append(ParentNode(node.tag, parts, node.props))
+    return children
+
+def _element(tag, children, props=None):
+    return ParentNode(tag, children, props) if children else LeafNode(tag, "", props)
+
+class _Container:
+    # An open block that holds other blocks: the document, a quote, a list or
+    # a list item. leaf is its open paragraph, code fence or table, if any.
+    # A list is loose once an empty line separates its items or the blocks
+    # in one of them.
+    __slots__ = ("kind", "children", "leaf", "ordered", "content_indent", "loose")
+
+    def __init__(self, kind, ordered=False, content_indent=0):
+        self.kind = kind
+        self.children = []
+        self.leaf = None
+        self.ordered = ordered
+        self.content_indent = content_indent
+        self.loose = False
+
+class _Leaf:
+    __slots__ = ("kind", "lines", "alignments", "language")
+
+    def __init__(self, kind, lines, alignments=None, language=None):
+        self.kind = kind
+        self.lines = lines
+        self.alignments = alignments
+        self.language = language
+
+# The most containers open at once, the document included. Quote and list
+# markers past it are kept as text, so hostile input can't nest elements
+# deep enough to exhaust the stack when they are serialized.
+MAX_NESTING = 100
+
+class BlockParser:
+    """Builds the HTML nodes for markdown fed to it one line at a time.
+
+    The open blocks are kept on a stack, from the document down to the
+    innermost quote or list item. Each line is matched against the stack
+    from the bottom up, once: a quote goes on through a line starting with
+    ">", a list item through a line indented to its content. What is left
+    of the line opens new blocks, or goes to the innermost open paragraph,
+    code fence or table. So nested lists, quotes and tables are built in a
+    single pass, in time linear in the size of the input.
+
+    With a toc.TableOfContents, headings get an id from it and are added to
+    it in order. headings counts the headings rendered either way.
+    """
+
+    def __init__(self, basepath="/", toc=None):
+        self.basepath = basepath
+        self.toc = toc
+        self.headings = 0
+        self.stack = [_Container("document")]
+        # Whether the last line was empty
+        self.blank = False
+        # A chunk ending in a list, held back by render_chunk until the next
+        # chunk shows whether the list goes on
+        self.held = None
+
+    @property
+    def idle(self):
+        # Nothing is open, so what comes next renders as it would on its own
+        return len(self.stack) == 1 and self.stack[0].leaf is None
+
+    @property
+    def in_fence(self):
+        leaf = self.stack[-1].leaf
+        return leaf is not None and leaf.kind == "fence"
+
+    def take(self):
+        """Returns the top-level nodes completed since the last call."""
+        nodes = self.stack[0].children
+        self.stack[0].children = []
+        return nodes
+
+    def feed(self, line):
+        stack = self.stack
+        depth = len(stack)
+        pos = 0
+        matched = 1
+        while matched < depth:
+            container = stack[matched]
+            indent_end = INDENT.match(line, pos).end()
+            if container.kind == "quote":
+                if not line.startswith(">", indent_end):
+                    break
+                pos = indent_end + 1
+                if line.startswith(" ", pos):
+                    pos += 1
+                matched += 1
+                continue
+            # A list, with its open item right above it
+            item = stack[matched + 1]
+            if indent_end - pos >= item.content_indent or self._is_blank(line, indent_end):
+                pos = min(pos + item.content_indent, indent_end)
+                matched += 2
+                continue
+            marker = LIST_MARKER.match(line, indent_end)
+            if marker is not None and (line[indent_end] not in "-*+") == container.ordered:
+                # The next item of the same list
+                matched += 1
+            break
+
+        leaf = stack[-1].leaf
+        if matched == depth and leaf is not None and leaf.kind == "fence":
+            rest = line[pos:] if pos else line
+            if "```" in rest and is_fence_line(rest):
+                self._close_leaf(stack[-1])
+            else:
+                leaf.lines.append(rest)
+            return
+
+        indent_end = INDENT.match(line, pos).end()
+        if self._is_blank(line, indent_end):
+            if not line:
+                # An empty line ends paragraphs, tables and quotes. Lists go
+                # on if the next line still belongs to them.
+                self._close_to(matched)
+                self._close_leaf(stack[-1])
+                self.blank = True
+            elif stack[matched - 1].kind == "quote":
+                # A line with nothing but a ">" ends the blocks inside the
+                # quote, and is a line break in its text
+                self._close_to(matched)
+                container = stack[-1]
+                if container.leaf is not None and container.leaf.kind == "text":
+                    container.leaf.lines.append("")
+                else:
+                    self._close_leaf(container)
+            return
+
+        if self.blank:
+            self.blank = False
+            for container in reversed(stack[1:matched]):
+                if container.kind == "list":
+                    container.loose = True
+                    break
+
+        if (matched < depth and leaf is not None and leaf.kind == "text"
+                and not self._starts_block(line, indent_end)):
+            # A lazy continuation line: a paragraph goes on even without the
+            # ">" or indentation of the blocks it is in
+            leaf.lines.append(line[pos:])
+            return
+
+        if matched < depth:
+            self._close_to(matched)
+        while True:
+            container = stack[-1]
+            first = line[indent_end]
+            leaf = container.leaf
+            # A list item takes two containers, the list and the item
+            nesting = len(stack) < MAX_NESTING - 1
+            if leaf is not None and leaf.kind == "text" and first in "|:-":
+                alignments = _table_alignments(line[indent_end:])
+                header = leaf.lines[-1]
+                if alignments is not None and "|" in header and len(_table_cells(header)) == len(alignments):
+                    leaf.lines.pop()
+                    if not leaf.lines:
+                        container.leaf = None
+                    self._close_leaf(container)
+                    container.leaf = _Leaf("table", [header], alignments)
+                    return
+            if first == ">" and nesting:
+                self._close_leaf(container)
+                stack.append(_Container("quote"))
+                pos = indent_end + 1
+                if line.startswith(" ", pos):
+                    pos += 1
+                indent_end = INDENT.match(line, pos).end()
+                if indent_end == len(line):
+                    return
+                continue
+            marker = LIST_MARKER.match(line, indent_end) if first in LIST_MARKER_FIRST and nesting else None
+            if marker is not None and (container.kind == "list" or marker.end() < len(line)):
+                # A marker alone on its line only adds an item to a list
+                # already open
+                content_indent = marker.end() - pos
+                if marker.end() == len(line):
+                    content_indent += 1
+                if container.kind != "list":
+                    self._close_leaf(container)
+                    stack.append(_Container("list", ordered=first not in "-*+"))
+                stack.append(_Container("item", content_indent=content_indent))
+                pos = indent_end = marker.end()
+                if pos == len(line):
+                    return
+                continue
+            if line.startswith("```", indent_end):
+                self._close_leaf(container)
+                # The language is the first word after the backticks
+                info = line[indent_end + 3:].split(None, 1)
+                container.leaf = _Leaf("fence", [], language=info[0] if info else None)
+                return
+            if first == "#" and HEADING_PATTERN.match(line, indent_end):
+                self._close_leaf(container)
+                container.children.append(self._heading(line[indent_end:]))
+                return
+            rest = line[pos:] if pos else line
+            if leaf is not None and leaf.kind != "fence":
+                leaf.lines.append(rest)
+            else:
+                self._close_leaf(container)
+                container.leaf = _Leaf("text", [rest])
+            return
+
+    def close(self):
+        """Closes every open block and returns the top-level nodes.
+
+        A code fence left open runs to its last line that isn't blank.
+        """
+        for container in self.stack:
+            leaf = container.leaf
+            if leaf is not None and leaf.kind == "fence":
+                while leaf.lines and not leaf.lines[-1].strip():
+                    leaf.lines.pop()
+        self._close_to(1)
+        self._close_leaf(self.stack[0])
+        return self.stack[0].children
+
+    @staticmethod
+    def _is_blank(line, indent_end):
+        return indent_end == len(line) or (line[indent_end].isspace() and line[indent_end:].isspace())
+
+    @staticmethod
+    def _starts_block(line, indent_end):
+        first = line[indent_end]
+        return (first == ">" or line.startswith("```", indent_end)
+                or (first == "#" and HEADING_PATTERN.match(line, indent_end) is not None)
+                or (first in LIST_MARKER_FIRST and LIST_MARKER.match(line, indent_end) is not None))
+
+    def _close_to(self, depth):
+        stack = self.stack
+        while len(stack) > depth:
+            container = stack.pop()
+            self._close_leaf(container)
+            children = container.children
+            if container.kind == "quote":
+                stack[-1].children.append(_element("blockquote", children))
+            elif container.kind == "item":
+                # Items without content are dropped
+                if children:
+                    stack[-1].children.append(children)
+            elif children:
+                items = [ParentNode("li", self._item_children(item, container.loose)) for item in children]
+                stack[-1].children.append(ParentNode("ol" if container.ordered else "ul", items))
+
+    @staticmethod
+    def _item_children(children, loose):
+        # The paragraphs of an item are kept as lists of inline nodes until
+        # the list closes: loose lists put them in <p>, tight ones don't
+        nodes = []
+        for child in children:
+            if type(child) is not list:
+                nodes.append(child)
+            elif loose:
+                nodes.append(_element("p", child))
+            else:
+                nodes.extend(child)
+        return nodes
+
+    def _close_leaf(self, container):
+        leaf = container.leaf
+        if leaf is None:
+            return
+        container.leaf = None
+        if leaf.kind == "fence":
+            container.children.append(self._code(leaf.lines, leaf.language))
+        elif leaf.kind == "table":
+            container.children.append(self._table(leaf.lines, leaf.alignments))
+        elif container.kind == "document":
+            text = " ".join(line.strip() for line in leaf.lines)
+            container.children.append(_element("p", self._inline(text)))
+        elif container.kind == "quote":
+            text = LINE_BREAK.join(line.rstrip().replace(LINE_BREAK, "\ufffd") for line in leaf.lines)
+            container.children.extend(_with_line_breaks(text_to_textnodes(text), self.basepath))
+        else:
+            text = "\n".join(line.lstrip() for line in leaf.lines).strip()
+            container.children.append(self._inline(text))
+
+    def _inline(self, text):
+        return [text_node_to_html_node(text_node, self.basepath) for text_node in text_to_textnodes(text)]
+
+    def _heading(self, line):
+        level = len(line) - len(line.lstrip("#"))
+        text_nodes = text_to_textnodes(line[level:].strip())
+        self.headings += 1
+        props = None
+        if self.toc is not None:
+            props = {"id": self.toc.add(level, "".join(text_node.text for text_node in text_nodes))}
+        return _element(f"h{level}", [text_node_to_html_node(text_node, self.basepath) for text_node in text_nodes],
+                        props)
+
+    def _code(self, lines, language):
+        non_empty = [line for line in lines if line.strip() != ""]
+        if non_empty:
+            min_indent = min(len(l) - len(l.lstrip(" ")) for l in non_empty)
+            lines = [l[min_indent:] if len(l) >= min_indent else "" for l in lines]
+        code_content = "\n".join(lines)
+        if not code_content.endswith("\n"):
+            code_content += "\n"
+        if language is None:
+            code_text_node = TextNode(code_content, TextType.CODE)
+            return ParentNode("pre", children=[text_node_to_html_node(code_text_node)])
+        props = {"class": f"language-{language}"}
+        html = highlight.highlight(code_content, language)
+        if html is None:
+            return ParentNode("pre", [LeafNode("code", code_content, props)])
+        return ParentNode("pre", [ParentNode("code", [RawNode(html)], props)])
+
+    def _table(self, lines, alignments):
+        head = ParentNode("thead", [self._table_row(lines[0], "th", alignments)])
+        if len(lines) == 1:
+            return ParentNode("table", [head])
+        body = ParentNode("tbody", [self._table_row(line, "td", alignments) for line in lines[1:]])
+        return ParentNode("table", [head, body])
+
+    def _table_row(self, line, tag, alignments):
+        # Short rows are padded with empty cells, long ones cut to the header
+        cells = _table_cells(line)
+        cells += [""] * (len(alignments) - len(cells))
+        return ParentNode("tr", [
+            _element(tag, self._inline(cell), {"align": alignment} if alignment else None)
+            for cell, alignment in zip(cells, alignments)
+        ])
+
+def block_to_html_nodes(block, basepath="/", toc=None):
+    parser = BlockParser(basepath, toc)
+    for line in block.split("\n"):
+        parser.feed(line)
+    return parser.close()
+
+def block_to_html_node(block, basepath="/", toc=None):
+    nodes = block_to_html_nodes(block, basepath, toc)
+    if len(nodes) > 1:
+        # A block with several elements, like a paragraph running straight
+        # into a list
+        return RawNode("".join(node.to_html() for node in nodes))
+    return nodes[0] if nodes else None
+
+# Shared by every page a process renders, so boilerplate blocks repeated
+# across a site (licence footers, common code fences) are rendered once
+block_cache = BlockCache()
+
+# How the HTML of a chunk ends when its last block is a list
+LIST_END = ("</ul>", "</ol>")
+
+def _feed_chunk(parser, text, blank_lines):
+    for line in text.split("\n"):
+        parser.feed(line)
+    # The end of the page closes blocks the same way as an empty line, but
+    # a code fence left open there is only closed by parser.close()
+    if not blank_lines and parser.in_fence:
+        return
+    for _ in range(max(blank_lines, 1)):
+        parser.feed("")
+
+def _goes_on(text):
+    # Whether a chunk can go on with a list left open by the chunk before
+    # it: after an empty line only an indented line or a list item can
+    first = text[:1]
+    return first.isspace() or (first in LIST_MARKER_FIRST and LIST_MARKER.match(text) is not None)
+
+def _cached(html):
+    return [RawNode(html)] if html else []
+
+def _release(parser, goes_on):
+    # Settles the chunk held back by render_chunk, and returns its nodes
+    text, blank_lines, headings, html, nodes = parser.held
+    parser.held = None
+    if html is not None:
+        # The chunk was found in the block cache but not fed to parser, so
+        # if its list goes on it has to be rendered after all
+        block_cache.count_lookup(not goes_on)
+        if not goes_on:
+            return _cached(html)
+        _feed_chunk(parser, text, blank_lines)
+        return parser.take()
+    if goes_on:
+        return nodes
+    # The list ends here, the same way as at the end of a page
+    parser.close()
+    nodes += parser.take()
+    if parser.headings != headings:
+        return nodes
+    html = "".join(node.to_html() for node in nodes)
+    block_cache.put(text, parser.basepath, html)
+    return _cached(html)
+
+def render_chunk(parser, text, blank_lines):
+    """Feeds a chunk from iter_chunks to parser, and returns the top-level
+    nodes completed so far.
+
+    A chunk that parser starts with nothing open renders the same anywhere,
+    as long as what it leaves open ends after it. Its HTML goes in the block
+    cache, unless it has headings, whose ids depend on the headings before
+    them on the page. Only a list stays open across the empty line after a
+    chunk, so a chunk ending in one is held back until the next chunk, and
+    is only cached, or taken from the cache, if that chunk doesn't go on
+    with the list.
+    """
+    nodes = _release(parser, _goes_on(text)) if parser.held is not None else []
+    cacheable = block_cache.enabled and parser.idle
+    if cacheable:
+        html = block_cache.get(text, parser.basepath, count=False)
+        if html is not None and html.endswith(LIST_END):
+            parser.held = (text, blank_lines, parser.headings, html, None)
+            return nodes
+        block_cache.count_lookup(html is not None)
+        if html is not None:
+            return nodes + _cached(html)
+    headings = parser.headings
+    _feed_chunk(parser, text, blank_lines)
+    if cacheable and parser.headings == headings:
+        if not parser.idle:
+            parser.held = (text, blank_lines, headings, None, parser.take())
+            return nodes
+        html = "".join(node.to_html() for node in parser.take())
+        block_cache.put(text, parser.basepath, html)
+        return nodes + _cached(html)
+    return nodes + parser.take()
+
+def close_chunks(parser):
+    # The nodes left once render_chunk has had the last chunk of a page
+    nodes = _release(parser, False) if parser.held is not None else []
+    return nodes + parser.close()
+
+def iter_html_nodes(chunks, basepath="/", toc=None):
+    # The top-level nodes of a page, each as soon as it is complete
+    parser = BlockParser(basepath, toc)
+    for text, blank_lines in chunks:
+        yield from render_chunk(parser, text, blank_lines)
+    yield from close_chunks(parser)
+
+def markdown_to_html_node(markdown, basepath="/", toc=None):
+    # toc is an optional toc.TableOfContents that gives headings their ids
+    # and collects them
+    return ParentNode("div", children=list(iter_html_nodes(iter_chunks(markdown.split("\n")), basepath, toc)))
+
+def split_title(chunks):
+    # Returns the title and an iterator over all the chunks, including the
+    # ones already read while looking for it, so a page is only split once
+    chunks = iter(chunks)
+    seen = []
+    for chunk in chunks:
+        seen.append(chunk)
+        text = chunk[0].lstrip()
+        if text.startswith("# "):
+            return text[2:].split("\n", 1)[0].strip(), itertools.chain(seen, chunks)
     raise ValueError("No title found in markdown")
-    
-def generate_page(from_path, template_path, dest_path, basepath):
-    print(f"Generating page from {from_path} to {dest_path} using template {template_path}...")
-    with open(from_path, "r", encoding="utf-8") as f:
-        markdown = f.read()
-    title = extract_title(markdown)
-    content_node = markdown_to_html_node(markdown)
-    content_html = content_node.to_html()
-    with open(template_path, "r", encoding="utf-8") as f:
-        template = f.read()
-    page_html = template.replace("{{ Title }}", title).replace("{{ Content }}", content_html)
-    page_html = page_html.replace("href=\"/", f"href=\"{basepath}").replace("src=\"/", f"src=\"{basepath}")
-    with open(dest_path, "w", encoding="utf-8") as f:
-        f.write(page_html)
+
+def find_title(chunks):
+    return split_title(chunks)[0]
+
+def extract_title(markdown):
+    return find_title(iter_chunks(markdown.split("\n")))
+
+def _write_nodes(out, nodes, timer):
+    with timer.stage("serialize"):
+        for node in nodes:
+            node.write_html(out)
+
+def write_blocks(out, chunks, basepath, timer=NULL_TIMER, toc=None):
+    # Renders the chunks from iter_chunks or iter_file_chunks
+    out.write("<div>")
+    parser = BlockParser(basepath, toc)
+    while True:
+        with timer.stage("block split"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        with timer.stage("inline parse"):
+            nodes = render_chunk(parser, *chunk)
+        _write_nodes(out, nodes, timer)
+    with timer.stage("inline parse"):
+        nodes = close_chunks(parser)
+    _write_nodes(out, nodes, timer)
+    out.write("</div>")
+
+def render_fragment(chunks, out, basepath, timer=NULL_TIMER):
+    # Writes the content HTML to out as it is rendered, and returns the title
+    # and the table of contents entries, which are only complete at the end
+    with timer.stage("extract_title"):
+        title, chunks = split_title(chunks)
+    toc = TableOfContents()
+    write_blocks(out, chunks, basepath, timer, toc)
+    return title, toc.entries
+
+# A rendered page takes two content cache entries: the content HTML under
+# the fragment key, and the title and table of contents entries as a JSON
+# array under the key plus this suffix, stored once the content is
+HEADER_SUFFIX = "-header"
+
+def store_fragment_header(cache, key, title, toc_entries):
+    with cache.writer(key + HEADER_SUFFIX) as f:
+        json.dump([title, toc_entries], f)
+
+def open_fragment(cache, key):
+    # Returns the title, the table of contents entries and the content entry
+    # opened for reading, or None if eviction left either entry missing
+    header = cache.open(key + HEADER_SUFFIX, count=False)
+    content = cache.open(key, count=False)
+    if header is None or content is None:
+        for f in (header, content):
+            if f is not None:
+                f.close()
+        cache.merge_counts(0, 1)
+        return None
+    with header:
+        title, toc_entries = json.load(header)
+    cache.merge_counts(1, 0)
+    return title, toc_entries, content
+
+# Pages this process wrote, found byte-identical to their existing output,
+# or skipped because the manifest had them up to date
+page_counts = collections.Counter()
+
+def page_values(title, content, toc_entries):
+    # The template slots of a page; {{ TOC }} is empty without entries
+    return {"Title": escape_text(title), "Content": content,
+            "TOC": toc_html(toc_entries) if toc_entries is not None else ""}
+
+def write_page(dest_path, template, title, write_content, timer=NULL_TIMER, toc_entries=None):
+    # Returns whether dest_path changed. Readers of dest_path never see a
+    # half-written page, and an identical page keeps its old mtime.
+    output = AtomicFile(dest_path)
+    with timer.stage("write"):
+        with output as out:
+            with timer.stage("template render"):
+                template.write(out, page_values(title, write_content, toc_entries))
+    page_counts["written" if output.changed else "unchanged"] += 1
+    return output.changed
+
+def generate_page(from_path, template_path, dest_path, basepath, manifest=None, timer=None, cache=None):
+    # timer is an optional stats.PageTimer that records where the time goes,
+    # cache an optional cache.DiskCache of rendered content
+    timer = timer or NULL_TIMER
+    if manifest is not None or cache is not None:
+        with timer.stage("manifest check"):
+            content_hash, references = scan_source(from_path)
+    if manifest is not None:
+        with timer.stage("manifest check"):
+            template_hash = manifest.template_hash(template_path)
+            current = manifest.is_current(dest_path, content_hash, template_hash, basepath)
+        if current:
+            info(f"Skipping unchanged page {from_path}")
+            page_counts["skipped"] += 1
+            return False
+    info(f"Generating page from {from_path} to {dest_path} using template {template_path}...")
+    template = load_template(template_path, basepath)
+
+    if cache is not None:
+        key = fragment_key(content_hash, basepath)
+        fragment = open_fragment(cache, key)
+        if fragment is None:
+            # Rendered straight into the cache entry, then served from there
+            with cache.writer(key) as f:
+                title, toc_entries = render_fragment(iter_file_chunks(from_path, timer), f, basepath, timer)
+            store_fragment_header(cache, key, title, toc_entries)
+            content = open(cache.path(key), "r", encoding="utf-8")
+        else:
+            title, toc_entries, content = fragment
+        with content:
+            def write_content(out):
+                content.seek(0)
+                shutil.copyfileobj(content, out)
+            write_page(dest_path, template, title, write_content, timer, toc_entries)
+    else:
+        with timer.stage("extract_title"):
+            title, chunks = split_title(iter_file_chunks(from_path, timer))
+        if "TOC" in template.names:
+            # The table of contents is only complete once the content is
+            # rendered, so render it first
+            toc = TableOfContents()
+            content = io.StringIO()
+            write_blocks(content, chunks, basepath, timer, toc)
+            write_page(dest_path, template, title, content.getvalue(), timer, toc.entries)
+        else:
+            # Stream the content one block at a time, so memory is bounded by
+            # the largest block rather than the whole page
+            def write_content(out):
+                nonlocal chunks
+                if chunks is None:
+                    # A template with more than one {{ Content }} slot
+                    chunks = iter_file_chunks(from_path, timer)
+                write_blocks(out, chunks, basepath, timer, TableOfContents())
+                chunks = None
+            write_page(dest_path, template, title, write_content, timer)
+
+    if manifest is not None:
+        manifest.record(dest_path, from_path, content_hash, template_hash, basepath, template_path, references)
+    return True
         
 
-def generate_pages_recursive(dir_path_content, template_path, dest_dir_path, basepath):
-    for entry in os.listdir(dir_path_content):
+def find_pages(dir_path_content, dest_dir_path, shard=None):
+    # shard is an optional (index, count) pair, 1-based, selecting the pages
+    # shard_of puts in that shard
+    pages = []
+    for entry in sorted(os.listdir(dir_path_content)):
         entry_path = os.path.join(dir_path_content, entry)
         if os.path.isdir(entry_path):
-            print(f"Entering directory {entry_path}...")
             sub_dest_dir = os.path.join(dest_dir_path, entry)
-            if not os.path.exists(sub_dest_dir):
-                os.makedirs(sub_dest_dir, exist_ok=True)
-            generate_pages_recursive(entry_path, template_path, sub_dest_dir, basepath)
+            pages.extend(find_pages(entry_path, sub_dest_dir))
         elif entry.endswith(".md"):
-            rel_dir = os.path.relpath(dir_path_content, start=dir_path_content)
-            dest_subdir = dest_dir_path if rel_dir == "." else os.path.join(dest_dir_path, rel_dir)
             dest_filename = os.path.splitext(entry)[0] + ".html"
-            dest_path = os.path.join(dest_subdir, dest_filename)
-            print(f"Processing file {entry_path} to {dest_path}...")
-            generate_page(entry_path, template_path, dest_path, basepath)
\ No newline at end of file
+            pages.append((entry_path, os.path.join(dest_dir_path, dest_filename)))
+    if shard is not None:
+        index, count = shard
+        pages = [page for page in pages if shard_of(page[0], dir_path_content, count) == index]
+    return pages
+
+
+def shard_of(from_path, dir_path_content, count):
+    # The shard, from 1 to count, that builds a page. It only depends on the
+    # source's path inside the content tree, so every machine agrees on it
+    # and adding a page never moves the others.
+    rel_path = os.path.relpath(from_path, dir_path_content).replace(os.sep, "/")
+    return int(hashlib.sha256(rel_path.encode("utf-8")).hexdigest()[:16], 16) % count + 1
+
+
+def page_outputs(dir_path_content, dest_dir_path):
+    # Normalized output paths of every page, as sync_tree's keep expects
+    return {os.path.normpath(dest_path) for _, dest_path in find_pages(dir_path_content, dest_dir_path)}
+
+
+def page_dest_path(from_path, dir_path_content, dest_dir_path):
+    rel_path = os.path.relpath(from_path, dir_path_content)
+    return os.path.join(dest_dir_path, os.path.splitext(rel_path)[0] + ".html")
+
+
+def _lookups(disk_cache):
+    return (disk_cache.hits, disk_cache.misses) if disk_cache is not None else (0, 0)
+
+
+def _generate_page_job(job):
+    # Runs in a worker process: capture the page's log so the parent can
+    # print it in page order, and report failures instead of raising
+    from_path, template_path, dest_path, basepath, manifest, cache, highlight_cache, timed, quiet = job
+    console.quiet = quiet
+    highlight.disk_cache = highlight_cache
+    timer = PageTimer(from_path) if timed else None
+    log = io.StringIO()
+    error = None
+    # A worker gets one copy of each disk cache per chunk of jobs, so report
+    # the lookups this job made rather than the copies' running totals
+    disk_caches = (cache, highlight_cache)
+    disk_counts = [_lookups(disk_cache) for disk_cache in disk_caches]
+    hits, misses = block_cache.hits, block_cache.misses
+    counts = page_counts.copy()
+    with contextlib.redirect_stdout(log):
+        try:
+            generate_page(from_path, template_path, dest_path, basepath, manifest, timer, cache)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    block_counts = (block_cache.hits - hits, block_cache.misses - misses)
+    disk_counts = [(hits - hits_before, misses - misses_before)
+                   for (hits, misses), (hits_before, misses_before)
+                   in zip(map(_lookups, disk_caches), disk_counts)]
+    return log.getvalue(), manifest, disk_counts, block_counts, page_counts - counts, timer, error
+
+
+def generate_pages_recursive(dir_path_content, template_path, dest_dir_path, basepath, manifest=None, jobs=1,
+                             stats=None, cache=None, shard=None):
+    pages = [
+        (from_path, find_template(from_path, dir_path_content, template_path), dest_path)
+        for from_path, dest_path in find_pages(dir_path_content, dest_dir_path, shard)
+    ]
+    for dest_dir in sorted({os.path.dirname(dest) for _, _, dest in pages}):
+        os.makedirs(dest_dir, exist_ok=True)
+    if manifest is not None:
+        for page_template in sorted({template for _, template, _ in pages}):
+            manifest.template_hash(page_template)
+
+    failures = []
+    if jobs <= 1:
+        for from_path, page_template, dest_path in pages:
+            info(f"Processing file {from_path} to {dest_path}...")
+            timer = PageTimer(from_path) if stats is not None else None
+            try:
+                generate_page(from_path, page_template, dest_path, basepath, manifest, timer, cache)
+            except Exception as e:
+                print(f"Failed to generate {from_path}: {type(e).__name__}: {e}")
+                failures.append((from_path, f"{type(e).__name__}: {e}"))
+            if stats is not None:
+                stats.add(timer)
+        return failures
+
+    if manifest is not None:
+        manifest.hash_dependencies(dest_path for _, _, dest_path in pages)
+    work = [
+        (from_path, page_template, dest_path, basepath,
+         manifest.subset(dest_path, page_template) if manifest is not None else None,
+         cache, highlight.disk_cache, stats is not None, console.quiet)
+        for from_path, page_template, dest_path in pages
+    ]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(_generate_page_job, work, chunksize=8)
+        for (from_path, _, dest_path), result in zip(pages, results):
+            log, part, disk_counts, block_counts, counts, timer, error = result
+            info(f"Processing file {from_path} to {dest_path}...")
+            print(log, end="")
+            if manifest is not None:
+                manifest.merge(part)
+            for disk_cache, lookups in zip((cache, highlight.disk_cache), disk_counts):
+                if disk_cache is not None:
+                    disk_cache.merge_counts(*lookups)
+            block_cache.merge_counts(*block_counts)
+            page_counts.update(counts)
+            if stats is not None:
+                stats.add(timer)
+            if error is not None:
+                print(f"Failed to generate {from_path}: {error}")
+                failures.append((from_path, error))
+    return failures
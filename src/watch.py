@@ -0,0 +1,368 @@
+"""Rebuild the site as files change and serve it with live reload.
+
+    python3 src/watch.py [--port 8888] [--poll]
+
+Watches content/, static/ and template.html, regenerates only the pages
+and assets an edit affects, and serves docs/ on a local threaded server
+whose pages reload themselves after every rebuild.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import functools
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from console import info
+from main import CONTENT_DIR, MANIFEST_PATH, OUTPUT_DIR, STATIC_DIR, TEMPLATE_PATH
+from manifest import BuildManifest
+from sync import copy_file, sync_tree
+from template import TEMPLATE_FILENAME, find_template
+from utility import find_pages, generate_page, generate_pages_recursive, page_dest_path, page_outputs
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct("iIII")
+
+LIVERELOAD_PATH = "/__livereload"
+LIVERELOAD_SCRIPT = (
+    b'<script>new EventSource("' + LIVERELOAD_PATH.encode() + b'")'
+    b".onmessage = function () { location.reload(); };</script>"
+)
+
+
+class PollingWatcher:
+    """Finds changes by comparing mtimes and sizes between scans."""
+
+    def __init__(self, paths, interval=0.1):
+        self.paths = paths
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    for name in filenames:
+                        self._stat(os.path.join(dirpath, name), snapshot)
+            else:
+                self._stat(path, snapshot)
+        return snapshot
+
+    def _stat(self, path, snapshot):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        snapshot[os.path.normpath(path)] = (stat.st_mtime_ns, stat.st_size)
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(path) != self.snapshot.get(path)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify through libc, watching directories recursively.
+
+    Plain files are watched through their parent directory, and events for
+    other files in that directory are ignored.
+    """
+
+    def __init__(self, paths):
+        libc_name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+        if libc is None or not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.files = set()
+        for path in paths:
+            if os.path.isdir(path):
+                self._watch_tree(path)
+            else:
+                self.files.add(os.path.normpath(path))
+                self._add_watch(os.path.dirname(path) or ".", recursive=False)
+
+    def _add_watch(self, directory, recursive):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        previous = self.watches.get(wd)
+        self.watches[wd] = (os.path.normpath(directory), recursive or (previous is not None and previous[1]))
+
+    def _watch_tree(self, root):
+        # Returns the files already inside, which matters for directories
+        # that appear after the watch started
+        found = set()
+        for dirpath, _, filenames in os.walk(root):
+            self._add_watch(dirpath, recursive=True)
+            found.update(os.path.normpath(os.path.join(dirpath, name)) for name in filenames)
+        return found
+
+    def poll(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                if wd not in self.watches:
+                    continue
+                directory, recursive = self.watches[wd]
+                path = os.path.normpath(os.path.join(directory, os.fsdecode(name)))
+                if not recursive and path not in self.files:
+                    continue
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                        changed |= self._watch_tree(path)
+                    continue
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(paths, polling=False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except OSError as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(paths)
+
+
+class SiteBuilder:
+    """Maps changed source files to the outputs that depend on them."""
+
+    def __init__(self, content_dir=CONTENT_DIR, template_path=TEMPLATE_PATH, static_dir=STATIC_DIR,
+                 output_dir=OUTPUT_DIR, manifest_path=MANIFEST_PATH, basepath="/"):
+        self.content_dir = os.path.normpath(content_dir)
+        self.template_path = os.path.normpath(template_path)
+        self.static_dir = os.path.normpath(static_dir)
+        self.output_dir = os.path.normpath(output_dir)
+        self.basepath = basepath
+        self.manifest = BuildManifest(manifest_path, static_dir)
+
+    @property
+    def watched_paths(self):
+        return [self.content_dir, self.static_dir, self.template_path]
+
+    def full_build(self):
+        keep = set(self.manifest.entries) | page_outputs(self.content_dir, self.output_dir)
+        sync_tree(self.static_dir, self.output_dir, keep=keep)
+        failures = generate_pages_recursive(self.content_dir, self.template_path, self.output_dir,
+                                            self.basepath, self.manifest)
+        self.manifest.prune()
+        self.manifest.save()
+        return failures
+
+    def _is_under(self, path, directory):
+        return path.startswith(directory + os.sep)
+
+    def pages_using(self, template_path):
+        return [
+            from_path for from_path, _ in find_pages(self.content_dir, self.output_dir)
+            if os.path.normpath(find_template(from_path, self.content_dir, self.template_path)) == template_path
+        ]
+
+    def rebuild(self, changed):
+        pages = set()
+        assets = set()
+        for path in changed:
+            path = os.path.normpath(path)
+            if path == self.template_path or (
+                    self._is_under(path, self.content_dir) and os.path.basename(path) == TEMPLATE_FILENAME):
+                pages.update(self.pages_using(path))
+                # A deleted template is used by no page anymore, but the pages
+                # built with it now fall back to another one
+                pages.update(self.manifest.dependents(path))
+            elif self._is_under(path, self.content_dir) and path.endswith(".md"):
+                pages.add(path)
+            elif self._is_under(path, self.static_dir):
+                assets.add(path)
+                # Pages linking to the asset were built against its old version
+                pages.update(self.manifest.dependents(path))
+
+        for path in sorted(assets):
+            dest_path = os.path.join(self.output_dir, os.path.relpath(path, self.static_dir))
+            if os.path.isfile(path):
+                info(f"Copying file from {path} to {dest_path}...")
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                copy_file(path, dest_path)
+            elif os.path.exists(dest_path):
+                info(f"Removing {dest_path}...")
+                os.remove(dest_path)
+
+        failures = []
+        for from_path in sorted(pages):
+            dest_path = page_dest_path(from_path, self.content_dir, self.output_dir)
+            if not os.path.isfile(from_path):
+                self.manifest.remove(dest_path)
+                continue
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            template_path = find_template(from_path, self.content_dir, self.template_path)
+            try:
+                generate_page(from_path, template_path, dest_path, self.basepath, self.manifest)
+            except Exception as e:
+                print(f"Failed to generate {from_path}: {type(e).__name__}: {e}")
+                failures.append((from_path, f"{type(e).__name__}: {e}"))
+        self.manifest.save()
+        return failures
+
+
+class LiveReload:
+    """Build counter that server threads can block on."""
+
+    def __init__(self):
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def notify(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait(self, version, timeout):
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+def inject_livereload(html):
+    index = html.rfind(b"</body>")
+    if index == -1:
+        return html + LIVERELOAD_SCRIPT
+    return html[:index] + LIVERELOAD_SCRIPT + html[index:]
+
+
+class DevRequestHandler(SimpleHTTPRequestHandler):
+    livereload = None
+
+    def do_GET(self):
+        if self.path == LIVERELOAD_PATH:
+            self.send_events()
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split("?", 1)[0].endswith("/"):
+            path = os.path.join(path, "index.html")
+        if not path.endswith(".html") or not os.path.isfile(path):
+            super().do_GET()
+            return
+        with open(path, "rb") as f:
+            body = inject_livereload(f.read())
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self):
+        # Server-sent events: one "reload" message per finished rebuild
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        version = self.livereload.version
+        try:
+            while True:
+                latest = self.livereload.wait(version, 15)
+                if latest != version:
+                    version = latest
+                    self.wfile.write(b"data: reload\n\n")
+                else:
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(directory, port, livereload):
+    class Handler(DevRequestHandler):
+        pass
+    Handler.livereload = livereload
+    server = ThreadingHTTPServer(("", port), functools.partial(Handler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def watch(builder, watcher, livereload, debounce=0.02):
+    while True:
+        changed = watcher.poll(1.0)
+        if not changed:
+            continue
+        # Editors often write a file in several steps; collect them into one rebuild
+        while True:
+            more = watcher.poll(debounce)
+            if not more:
+                break
+            changed |= more
+        start = time.perf_counter()
+        builder.rebuild(changed)
+        livereload.notify()
+        print(f"Rebuilt {len(changed)} changed file(s) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild on change and serve docs/ with live reload.")
+    parser.add_argument("basepath", nargs="?", default="/", help="URL prefix for root-relative links")
+    parser.add_argument("-p", "--port", type=int, default=8888)
+    parser.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify")
+    args = parser.parse_args(argv)
+
+    builder = SiteBuilder(basepath=args.basepath)
+    builder.full_build()
+    watcher = make_watcher(builder.watched_paths, polling=args.poll)
+    livereload = LiveReload()
+    server = serve(builder.output_dir, args.port, livereload)
+    print(f"Serving {builder.output_dir} on http://localhost:{args.port}/ ({type(watcher).__name__})")
+    try:
+        watch(builder, watcher, livereload)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()